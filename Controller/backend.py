@@ -0,0 +1,128 @@
+from __future__ import annotations
+import argparse
+import os
+from pathlib import Path
+import cv2
+import numpy as np
+
+# ===== Chọn backend cho detector biển số =====
+# BTL_DETECTOR = auto | torch | onnx | onnx-int8
+#   auto: có GPU -> torch (cuda); không có -> ONNX INT8 / ONNX nếu đã export, còn lại torch cpu
+DETECTOR_BACKEND = os.environ.get("BTL_DETECTOR", "auto")
+IMGSZ = 640
+
+def has_cuda() -> bool:
+    try:
+        import torch
+        return bool(torch.cuda.is_available())
+    except Exception:
+        return False
+
+def pick_device():
+    """0 (GPU đầu tiên) nếu có CUDA, ngược lại 'cpu'."""
+    return 0 if has_cuda() else "cpu"
+
+def onnx_paths(pt_path: Path) -> tuple[Path, Path]:
+    """best.pt -> (best.onnx, best_int8.onnx) cùng thư mục."""
+    return pt_path.with_suffix(".onnx"), pt_path.with_name(pt_path.stem + "_int8.onnx")
+
+def resolve_backend(model_path: Path, backend: str | None = None) -> tuple[str, Path]:
+    """(backend thực dùng, file weights sẽ nạp) theo BTL_DETECTOR; chưa export / lượng tử hoá gì."""
+    backend = backend or DETECTOR_BACKEND
+    model_path = Path(model_path)
+    if model_path.suffix == ".onnx":
+        return "onnx", model_path
+    fp32, int8 = onnx_paths(model_path)
+    if backend == "auto":
+        if has_cuda():
+            backend = "torch"
+        else:
+            backend = "onnx-int8" if int8.exists() else ("onnx" if fp32.exists() else "torch")
+    return backend, {"onnx-int8": int8, "onnx": fp32}.get(backend, model_path)
+
+def load_detector(model_path: Path, backend: str | None = None):
+    """Trả (YOLO model, device). File .onnx được ultralytics chạy bằng onnxruntime."""
+    from ultralytics import YOLO
+    model_path = Path(model_path)
+    backend, weights = resolve_backend(model_path, backend)
+    if weights.suffix != ".onnx":
+        return YOLO(weights.as_posix()), pick_device()
+    if not weights.exists() and model_path.suffix != ".onnx":
+        fp32, int8 = onnx_paths(model_path)
+        if backend == "onnx-int8":
+            quantize_int8(export_onnx(model_path) if not fp32.exists() else fp32)
+        else:
+            export_onnx(model_path)
+    return YOLO(weights.as_posix(), task="detect"), "cpu"
+
+# ===== Export / lượng tử hoá =====
+def export_onnx(pt_path: Path, imgsz: int = IMGSZ) -> Path:
+    """best.pt -> best.onnx (batch động để dùng được cho chế độ hàng loạt)."""
+    from ultralytics import YOLO
+    out = YOLO(Path(pt_path).as_posix()).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    return Path(out)
+
+def _letterbox(img, size=IMGSZ):
+    """Giống tiền xử lý của ultralytics: giữ tỉ lệ, pad 114, RGB, NCHW float [0,1]."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    img = cv2.copyMakeBorder(img, top, size - nh - top, left, size - nw - left,
+                             cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    x = img[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return x[None]
+
+def quantize_int8(onnx_path: Path, calib_dir: Path | None = None, n_calib: int = 100,
+                  imgsz: int = IMGSZ) -> Path:
+    """Lượng tử hoá tĩnh INT8 (QDQ) bằng ảnh calibration (mặc định: thư mục history/)."""
+    import onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_static)
+    onnx_path = Path(onnx_path)
+    out = onnx_path.with_name(onnx_path.stem + "_int8.onnx")
+    calib_dir = Path(calib_dir) if calib_dir else Path(__file__).resolve().parent.parent / "history"
+    files = sorted(p for p in calib_dir.rglob("*")
+                   if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".bmp"})[:n_calib]
+    if not files:
+        raise FileNotFoundError(f"Không có ảnh calibration trong {calib_dir}")
+    input_name = ort.InferenceSession(onnx_path.as_posix(),
+                                      providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class _Calib(CalibrationDataReader):
+        def __init__(self):
+            self._it = iter(files)
+        def get_next(self):
+            for p in self._it:
+                img = cv2.imread(str(p))
+                if img is not None:
+                    return {input_name: _letterbox(img, imgsz)}
+            return None
+
+    quantize_static(onnx_path.as_posix(), out.as_posix(), _Calib(),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # giữ metadata (names, stride, imgsz) để ultralytics nạp được file đã lượng tử hoá
+    src, dst = onnx.load(onnx_path.as_posix()), onnx.load(out.as_posix())
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, out.as_posix())
+    return out
+
+if __name__ == "__main__":
+    from Controller.ctl import RUNS_DIR, MODEL_DIR, _find_latest_best
+    ap = argparse.ArgumentParser(description="Export best.pt sang ONNX (tuỳ chọn INT8)")
+    ap.add_argument("--model", default=None, help="best.pt (mặc định: bản mới nhất trong runs/)")
+    ap.add_argument("--imgsz", type=int, default=IMGSZ)
+    ap.add_argument("--int8", action="store_true", help="lượng tử hoá INT8 sau khi export")
+    ap.add_argument("--calib", default=None, help="thư mục ảnh calibration (mặc định history/)")
+    ap.add_argument("--n-calib", type=int, default=100)
+    args = ap.parse_args()
+
+    pt = Path(args.model) if args.model else (_find_latest_best(RUNS_DIR) or (MODEL_DIR / "best.pt"))
+    path = export_onnx(pt, args.imgsz)
+    print("ONNX:", path)
+    if args.int8:
+        print("INT8:", quantize_int8(path, args.calib, args.n_calib, args.imgsz))
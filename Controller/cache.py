@@ -0,0 +1,105 @@
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import cv2
+import numpy as np
+
+from Model.Data import sql
+import metrics
+
+FIELDS = ("text", "raw", "conf", "ocr_conf", "ocr_min", "bbox")
+DB_MAX_ROWS = 50000     # tầng SQLite giữ tối đa ngần này ảnh (bỏ dòng ghi cũ nhất)
+TRIM_EVERY  = 256       # số lần put giữa 2 lần cắt bảng
+
+def model_fingerprint(path: Path, *config) -> str:
+    """Hash nội dung file weights + cấu hình pipeline (config): đổi weights, backend,
+    cờ detect/OCR hay phiên bản code -> cache cũ tự hết hiệu lực."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    for c in config:
+        h.update(repr(c).encode())
+    return h.hexdigest()
+
+def content_key(img) -> str:
+    """Hash chính xác của ảnh đã decode (kèm shape)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(img.shape).encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+def dhash(img, size: int = 16) -> int:
+    """Perceptual hash (dHash size x size bit): ảnh gần giống nhau -> ít bit khác."""
+    g = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    g = cv2.resize(g, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (g[:, 1:] > g[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+class RecognitionCache:
+    """
+    Cache kết quả nhận diện theo nội dung ảnh: list biển {text, raw, conf, ocr_conf, ocr_min, bbox}
+    ([] = ảnh không có biển). text là kết quả OCR chưa nắn theo biển đã biết.
+    - tầng 1: LRU trong RAM (max_items), khoá = hash chính xác
+    - tầng 2 (persist=True, tắt mặc định): bảng cache_nhan_dien trong bien_so.db,
+      tối đa db_max_rows dòng (bỏ dòng ghi cũ nhất)
+    - phash_dist > 0: thêm tra gần đúng bằng dHash trên tầng RAM (ảnh gần như trùng,
+      vd cùng khung hình bị nén lại). Tắt mặc định vì 2 xe khác nhau ở cùng góc máy
+      có thể cho hash gần nhau.
+    """
+    def __init__(self, model_fp: str, max_items: int = 1024, persist: bool = False,
+                 phash_dist: int = 0, db_max_rows: int = DB_MAX_ROWS):
+        self.model_fp = model_fp
+        self.max_items = max_items
+        self.persist = persist
+        self.phash_dist = phash_dist
+        self.db_max_rows = db_max_rows
+        self._puts = 0
+        self._lru: OrderedDict[str, tuple] = OrderedDict()   # key -> (value, phash)
+        self._lock = threading.Lock()
+        if persist:
+            sql.cache_don(model_fp)
+            sql.cache_cat(db_max_rows)
+
+    def get(self, key, ph=None):
+        """-> list biển, hoặc None (miss)."""
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is not None:
+                self._lru.move_to_end(key)
+                metrics.inc("btl_cache_total", result="hit_mem")
+                return hit[0]
+            if ph is not None:
+                for k, (v, p) in self._lru.items():
+                    if p is not None and bin(p ^ ph).count("1") <= self.phash_dist:
+                        self._lru.move_to_end(k)
+                        metrics.inc("btl_cache_total", result="hit_phash")
+                        return v
+        if self.persist:
+            v = sql.cache_lay(key, self.model_fp)
+            if v is not None:
+                for p in v:
+                    p["bbox"] = tuple(p["bbox"])
+                self._remember(key, v, ph)
+                metrics.inc("btl_cache_total", result="hit_db")
+                return v
+        metrics.inc("btl_cache_total", result="miss")
+        return None
+
+    def put(self, key, ph, plates: list[dict]):
+        v = [{k: p.get(k) for k in FIELDS} for p in plates]
+        self._remember(key, v, ph)
+        if self.persist:
+            sql.cache_luu(key, self.model_fp, v)
+            self._puts += 1
+            if self._puts % TRIM_EVERY == 0:
+                sql.cache_cat(self.db_max_rows)
+
+    def _remember(self, key, v, ph):
+        with self._lock:
+            self._lru[key] = (v, ph)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
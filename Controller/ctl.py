@@ -1,14 +1,21 @@
 from __future__ import annotations
 from tkinter import filedialog, messagebox
 from PIL import Image, ImageTk
-import subprocess
-import easyocr
+import threading
 import cv2
+import numpy as np
 import re
+import time
 from pathlib import Path
-from datetime import datetime
-from ultralytics import YOLO
 from Model.Data import sql
+from Model.plate_index import PlateIndex
+from detect_ocr import (SNAP_MIN_CONF, engine, readtext_batched, recognize_lines,
+                        recognize_lines_batched)
+import metrics
+from Controller.backend import load_detector, resolve_backend
+from Controller.cache import RecognitionCache, dhash, model_fingerprint
+from Controller.frame import ImageFrame, as_frame
+from Controller.store import get_store
 
 # ===== Paths / model =====
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
@@ -21,6 +28,23 @@ def _find_latest_best(runs_root: Path):
     cands = list((runs_root / "detect").glob("*/weights/best.pt"))
     return max(cands, key=lambda p: p.stat().st_mtime) if cands else None
 
+# ===== Detect / OCR config =====
+DET_CONF      = 0.18
+MULTI_CONF    = 0.35   # các biển phụ (ngoài biển conf cao nhất) phải đạt ngưỡng này
+OCR_ALLOWLIST = '0123456789ABCDEFGHJKLMNPRSTUVWXYZ-. '
+OCR_BATCH     = 16
+OCR_DETECT_KW = dict(text_threshold=0.55, low_text=0.3, link_threshold=0.3)
+OCR_KW        = dict(detail=1, allowlist=OCR_ALLOWLIST, paragraph=False, **OCR_DETECT_KW)
+OCR_DETECTOR_FREE = True   # crop YOLO -> chỉ chạy recognizer theo box dòng, bỏ CRAFT (xem detect_ocr)
+# đổi code detect / OCR làm kết quả khác đi thì tăng số này: cache cũ trong bien_so.db tự bị bỏ
+PIPELINE_VERSION = 2
+
+# ===== Detect thô -> tinh (ảnh camera lớn) =====
+COARSE_IMGSZ  = 640    # cạnh dài của ảnh thu nhỏ dùng để quét tìm biển (cũng là imgsz lượt quét)
+COARSE_MIN    = 2.0    # chỉ quét thu nhỏ khi ảnh lớn hơn COARSE_IMGSZ ít nhất chừng này lần
+REFINE_MARGIN = 0.5    # ROI refine = box thô nới thêm 50% mỗi phía, cắt từ ảnh gốc
+REFINE_IMGSZ  = 320    # imgsz của lượt detect lại trên các ROI
+
 # ===== Plate helpers =====
 PLATE_CANON = re.compile(r'^([1-9]\d)([A-Z]{1,2})(\d)(\d{4,5})$')
 def _norm(s: str) -> str:
@@ -49,6 +73,47 @@ def _format_from_raw(raw: str) -> str:
     s0 = _norm(s)
     return _pretty(s0) if PLATE_CANON.match(s0) else raw
 
+def _expand_box(img, xyxy, expand=0.12):
+    """Nới bbox (mặc định 12%), kẹp trong ảnh -> ((x1,y1,x2,y2), crop)."""
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = map(int, xyxy)
+    dw, dh = int((x2-x1)*expand), int((y2-y1)*expand)
+    x1 = max(0, x1-dw); y1 = max(0, y1-dh)
+    x2 = min(w-1, x2+dw); y2 = min(h-1, y2+dh)
+    return (x1, y1, x2, y2), img[y1:y2, x1:x2]
+
+# ===== OCR crop biển (dùng chung cho A_ctl và tiến trình OCR của Pipeline) =====
+def _ocr_crops(reader, plates) -> list[tuple[str, str, float, float]]:
+    """OCR nhiều crop -> [(text đã format, raw, conf OCR trung bình, conf box thấp nhất)];
+    >1 crop thì đi chung 1 batch. Chưa nắn theo biển đã biết (xem _snap)."""
+    # xám -> CLAHE -> ngưỡng thích nghi; view trong buffer PrepEngine của thread hiện tại
+    thrs = [engine().binarize(p, 31, 10, slot=i) for i, p in enumerate(plates)]
+    if OCR_DETECTOR_FREE:
+        results = ([recognize_lines(reader, thrs[0], allowlist=OCR_ALLOWLIST)]
+                   if len(thrs) == 1 else
+                   recognize_lines_batched(reader, thrs, OCR_BATCH, allowlist=OCR_ALLOWLIST))
+    elif len(thrs) == 1:
+        results = [reader.readtext(thrs[0], **OCR_KW)]
+    else:
+        results = readtext_batched(reader, thrs, OCR_BATCH, OCR_ALLOWLIST, **OCR_DETECT_KW)
+    out = []
+    for res in results:
+        raw = " ".join([t[1] for t in res]) if res else ""
+        oconf = sum(float(t[2]) for t in res) / len(res) if res else 0.0
+        omin = min(float(t[2]) for t in res) if res else 0.0
+        out.append((_format_from_raw(raw) if raw else "", raw, oconf, omin))
+    return out
+
+def _snap(index, text: str, raw: str, ocr_min: float) -> str:
+    """Chuỗi OCR chưa đúng dạng biển, cách 1 biển đã gặp <= 1 ký tự (và conf đủ) -> lấy biển đó."""
+    if index is None or not raw or ocr_min < SNAP_MIN_CONF:
+        return text
+    hit = index.snap(raw)
+    if not hit:
+        return text
+    metrics.inc("btl_snap_total")
+    return _pretty(hit)
+
 def _cv2_to_tk(img_bgr, size, upscale=False):
     h, w = img_bgr.shape[:2]
     sx = size[0]/w; sy = size[1]/h
@@ -61,26 +126,106 @@ def _cv2_to_tk(img_bgr, size, upscale=False):
     img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
     return ImageTk.PhotoImage(Image.fromarray(img_rgb))
 
+# ===== Lịch sử =====
+def save_history(bien_so: str, crop_bgr=None) -> int:
+    """Ghi 1 dòng lichsu (+ ảnh crop vào kho history/ nếu có), trả id bản ghi.
+    Ảnh trùng nội dung chỉ lưu 1 file; file được ghi ở thread nền (Controller/store.py)."""
+    img_path = None
+    try:
+        if crop_bgr is not None:
+            img_path = get_store(HISTORY_DIR).put(crop_bgr)
+    except Exception as e:
+        print("Save history image error:", e)
+    return sql.luu_lich_su(bien_so, img_path)
+
 # ===== Controller =====
 class A_ctl:
-    def __init__(self, window=None, model_path=None):
+    """
+    Nạp model ở thread nền (import easyocr/ultralytics cũng nằm trong đó) để cửa sổ hiện ngay.
+    Truy cập self.reader / self.detector sẽ chờ tới khi nạp + warm-up xong.
+    """
+    def __init__(self, window=None, model_path=None, background=True, backend=None,
+                 cache=True, cache_size=1024, cache_phash=0, cache_persist=False, known_plates=True,
+                 coarse_to_fine=True, coarse_imgsz=COARSE_IMGSZ, refine_imgsz=REFINE_IMGSZ,
+                 refine_margin=REFINE_MARGIN):
         self.window = window
         self._last_crop_bgr = None  # giữ ảnh crop gần nhất để lưu lịch sử
-
-        try:
-            self.reader = easyocr.Reader(['en'], gpu=True)
-        except Exception:
-            self.reader = easyocr.Reader(['en'], gpu=False)
+        self._last_plates = []      # mọi biển của lần detect_plate gần nhất
 
         mp = Path(model_path) if model_path else (_find_latest_best(RUNS_DIR) or (MODEL_DIR / "best.pt"))
         if not mp or not mp.exists():
             raise FileNotFoundError("Không tìm thấy best.pt")
-        self.detector = YOLO(mp.as_posix())
+        self.model_path = mp
+        self.backend = backend    # None -> theo BTL_DETECTOR (xem Controller/backend.py)
+        self.device = 'cpu'
+        # cache_persist=True: thêm tầng cache trong bien_so.db (giữ qua các lần chạy, giới hạn số dòng)
+        self._cache_opts = (cache_size, cache_phash, cache_persist) if cache else None
+        self.cache: RecognitionCache | None = None
+        self._use_known = known_plates
+        self.coarse_to_fine = coarse_to_fine
+        self.coarse_imgsz, self.refine_imgsz = coarse_imgsz, refine_imgsz
+        self.refine_margin = refine_margin
+        self.known: PlateIndex | None = None   # biển đã có trong lichsu (nắn kết quả OCR)
+
+        self._reader = self._detector = None
+        self.load_error: Exception | None = None
+        self.ready = threading.Event()
+        if background:
+            threading.Thread(target=self._load_models, name="model-loader", daemon=True).start()
+        else:
+            self._load_models()
+
+    def _load_models(self):
+        try:
+            import easyocr
+            try:
+                reader = easyocr.Reader(['en'], gpu=True)
+            except Exception:
+                reader = easyocr.Reader(['en'], gpu=False)
+            detector, self.device = load_detector(self.model_path, self.backend)
+            if self._cache_opts:
+                size, phash, persist = self._cache_opts
+                backend, weights = resolve_backend(self.model_path, self.backend)
+                fp = model_fingerprint(weights, PIPELINE_VERSION, backend, self.coarse_to_fine,
+                                       self.coarse_imgsz, self.refine_imgsz, self.refine_margin,
+                                       OCR_DETECTOR_FREE, self._use_known)
+                self.cache = RecognitionCache(fp, max_items=size, persist=persist, phash_dist=phash)
+            if self._use_known:
+                self.known = PlateIndex.from_db()
+
+            # warm-up: chạy thử 1 lần để lần nhận diện đầu không phải chờ khởi tạo
+            detector.predict(source=np.zeros((640, 640, 3), np.uint8), conf=DET_CONF,
+                             device=self.device, verbose=False)
+            dummy = np.full((64, 256), 255, np.uint8)
+            if OCR_DETECTOR_FREE:
+                recognize_lines(reader, dummy, allowlist=OCR_ALLOWLIST)
+            else:
+                reader.readtext(dummy, **OCR_KW)
+            self._reader, self._detector = reader, detector
+        except Exception as e:
+            self.load_error = e
+        finally:
+            self.ready.set()
+
+    def _wait_ready(self):
+        self.ready.wait()
+        if self.load_error is not None:
+            raise RuntimeError(f"Nạp model lỗi: {self.load_error}")
+
+    @property
+    def reader(self):
+        self._wait_ready()
+        return self._reader
+
+    @property
+    def detector(self):
+        self._wait_ready()
+        return self._detector
 
     def home(self):
-        if self.window:
-            self.window.destroy()
-        subprocess.run(["python", "main.py"])
+        """Về trạng thái ban đầu ngay trong tiến trình (model vẫn giữ trong RAM)."""
+        self._last_crop_bgr = None
+        self._last_plates = []
 
     def open_image(self):
         file_path = filedialog.askopenfilename(
@@ -93,70 +238,215 @@ class A_ctl:
         img_resized = img.resize((480, 350), Image.LANCZOS)
         return ImageTk.PhotoImage(img_resized), file_path
 
+    # === Pipeline không GUI ===
+    def _read_plates(self, plates) -> list[tuple[str, str, float, float]]:
+        return _ocr_crops(self.reader, plates)
+
+    def _snap_known(self, text: str, raw: str, ocr_min: float) -> str:
+        """Chạy sau cache: cache giữ kết quả OCR gốc, còn tập biển đã biết thì lớn dần."""
+        return _snap(self.known, text, raw, ocr_min)
+
+    def _apply_known(self, out: list[list[dict]]) -> list[list[dict]]:
+        for plates in out:
+            for p in plates:
+                p["text"] = self._snap_known(p["text"], p["raw"], p.get("ocr_min", 0.0))
+        return out
+
+    def _all_boxes(self, img, boxes):
+        """Mọi box đạt ngưỡng (biển tốt nhất luôn giữ), nới 12%, conf giảm dần
+        -> [(bbox, conf, crop)]. boxes: [(xyxy, conf)] theo toạ độ ảnh gốc."""
+        out = []
+        for rank, (xyxy, conf) in enumerate(sorted(boxes, key=lambda b: -b[1])):
+            if rank > 0 and conf < MULTI_CONF:
+                break
+            bbox, crop = _expand_box(img, xyxy)
+            out.append((bbox, float(conf), crop))
+        return out
+
+    def _predict(self, imgs, **kw) -> list[list[tuple[list, float]]]:
+        dets = self.detector.predict(source=list(imgs), conf=DET_CONF, device=self.device,
+                                     verbose=False, **kw)
+        return [list(zip(d.boxes.xyxy.tolist(), d.boxes.conf.tolist())) for d in dets]
+
+    def _detect(self, frames: list[ImageFrame]) -> list[list[tuple[list, float]]]:
+        """YOLO cho cả lô -> [(xyxy, conf)] theo ảnh, toạ độ ảnh gốc.
+        coarse_to_fine: ảnh lớn (camera 4K) được quét trên bản thu nhỏ (JPEG decode giảm cỡ,
+        xem ImageFrame); mỗi box thô đạt ngưỡng được detect lại trong ROI cắt từ ảnh gốc
+        (nới refine_margin) để box cho OCR sát biển ở độ phân giải thật.
+        Mọi ROI của cả lô đi chung 1 lần predict; ảnh không có biển không bao giờ decode đủ cỡ."""
+        if not self.coarse_to_fine:
+            return self._predict([f.full() for f in frames])
+        smalls, coarse = [], []
+        for f in frames:
+            W, H = f.size()
+            big = self.coarse_imgsz * COARSE_MIN <= max(W, H)
+            smalls.append(f.scaled(self.coarse_imgsz) if big else f.full())
+            coarse.append(big)
+        found = self._predict(smalls, imgsz=self.coarse_imgsz)
+
+        rois, owner = [], []
+        for i, (f, small) in enumerate(zip(frames, smalls)):
+            if not coarse[i] or not found[i]:
+                continue
+            img = f.full()
+            H, W = img.shape[:2]
+            sx, sy = W / small.shape[1], H / small.shape[0]
+            boxes, found[i] = found[i], []
+            for rank, (xyxy, conf) in enumerate(sorted(boxes, key=lambda b: -b[1])):
+                if rank > 0 and conf < MULTI_CONF:
+                    break
+                x1, y1, x2, y2 = xyxy[0] * sx, xyxy[1] * sy, xyxy[2] * sx, xyxy[3] * sy
+                mx, my = (x2 - x1) * self.refine_margin, (y2 - y1) * self.refine_margin
+                rx1, ry1 = max(0, int(x1 - mx)), max(0, int(y1 - my))
+                rx2, ry2 = min(W, int(x2 + mx) + 1), min(H, int(y2 + my) + 1)
+                rois.append(img[ry1:ry2, rx1:rx2])
+                owner.append((i, (rx1, ry1), [x1, y1, x2, y2], conf))
+        if rois:
+            with metrics.span(stage="detect_refine"):
+                refined = self._predict(rois, imgsz=self.refine_imgsz)
+            for (i, (ox, oy), coarse_xyxy, conf), boxes in zip(owner, refined):
+                if boxes:                            # box tốt nhất trong ROI, đổi về toạ độ ảnh gốc
+                    (bx1, by1, bx2, by2), conf = max(boxes, key=lambda b: b[1])
+                    found[i].append(([bx1 + ox, by1 + oy, bx2 + ox, by2 + oy], conf))
+                else:                                # không thấy lại -> giữ box thô đã phóng về
+                    found[i].append((coarse_xyxy, conf))
+            metrics.inc("btl_refine_total", len(rois))
+        return found
+
+    def recognize(self, img) -> dict | None:
+        """Nhận diện 1 ảnh (BGR hoặc ImageFrame), không đụng tới GUI, chỉ lấy biển conf cao nhất.
+        Trả dict {text, raw, conf, ocr_conf, bbox, crop, det_ms, ocr_ms} hoặc None nếu không thấy biển."""
+        return self.recognize_batch([img])[0]
+
+    def recognize_all(self, img) -> list[dict]:
+        """Mọi biển trong ảnh (conf giảm dần), mỗi biển 1 dict như recognize()."""
+        return self.recognize_all_batch([img])[0]
+
+    def recognize_batch(self, imgs) -> list[dict | None]:
+        """Như recognize_all_batch nhưng mỗi ảnh chỉ lấy biển conf cao nhất."""
+        return [plates[0] if plates else None for plates in self.recognize_all_batch(imgs)]
+
+    def read_crops(self, crops) -> list[dict]:
+        """OCR các crop biển đã cắt sẵn (vd theo track của video.py), cả lô 1 lần, không qua YOLO / cache.
+        Mỗi crop 1 dict {text, raw, ocr_conf}; text đã nắn theo biển đã biết."""
+        if not len(crops):
+            return []
+        self._wait_ready()
+        with metrics.span(stage="ocr"):
+            reads = self._read_plates(list(crops))
+        metrics.inc("btl_ocr_passes_total", len(reads), fn="a_ctl")
+        return [{"text": self._snap_known(text, raw, omin), "raw": raw, "ocr_conf": oconf}
+                for text, raw, oconf, omin in reads]
+
+    def recognize_all_batch(self, imgs) -> list[list[dict]]:
+        """Nhận diện nhiều ảnh (BGR hoặc ImageFrame): YOLO chạy 1 lần cho cả lô, OCR mọi biển
+        của cả lô 1 lần. Ảnh đã gặp (trùng nội dung) lấy từ cache, không chạy lại model."""
+        if not imgs:
+            return []
+        imgs = [as_frame(x) for x in imgs]
+        self._wait_ready()
+        if self.cache is None:
+            return self._apply_known(self._recognize_uncached(imgs))
+
+        out, keys, miss = [[] for _ in imgs], [None] * len(imgs), []
+        for i, f in enumerate(imgs):
+            keys[i] = (f.key(), dhash(f.reduced(8)) if self.cache.phash_dist > 0 else None)
+            v = self.cache.get(*keys[i])
+            if v is None:
+                miss.append(i); continue
+            for p in v:
+                x1, y1, x2, y2 = p["bbox"]
+                out[i].append(dict(p, crop=f.full()[y1:y2, x1:x2], det_ms=0.0, ocr_ms=0.0,
+                                   cached=True))
+        if miss:
+            for i, plates in zip(miss, self._recognize_uncached([imgs[i] for i in miss])):
+                self.cache.put(*keys[i], plates)     # put() chép các trường -> nắn sau không ảnh hưởng
+                out[i] = plates
+        return self._apply_known(out)
+
+    def _recognize_uncached(self, imgs: list[ImageFrame]) -> list[list[dict]]:
+        t0 = time.perf_counter()
+        with metrics.span(stage="detect"):
+            dets = self._detect(imgs)
+        det_ms = (time.perf_counter() - t0) * 1000 / len(imgs)  # chia đều cho cả lô
+        boxes = [self._all_boxes(f.full(), det) if det else [] for f, det in zip(imgs, dets)]
+        found = [b for bs in boxes for b in bs]
+        metrics.inc("btl_images_total", len(imgs))
+        metrics.inc("btl_detections_total", sum(len(d) for d in dets))
+        metrics.inc("btl_plates_total", len(found))
+        metrics.inc("btl_no_plate_total", sum(1 for bs in boxes if not bs))
+        if not found:
+            return [[] for _ in imgs]
+
+        # OCR mọi crop (mọi biển của mọi ảnh) trong 1 lần gọi
+        t0 = time.perf_counter()
+        with metrics.span(stage="ocr"):
+            reads = iter(self._read_plates([b[2] for b in found]))
+        metrics.inc("btl_ocr_passes_total", len(found), fn="a_ctl")
+        ocr_ms = (time.perf_counter() - t0) * 1000 / len(found)
+        out = []
+        for bs in boxes:
+            plates = []
+            for bbox, conf, plate in bs:
+                text, raw, oconf, omin = next(reads)
+                plates.append({"text": text, "raw": raw, "conf": conf, "ocr_conf": oconf, "ocr_min": omin,
+                               "bbox": bbox, "crop": plate, "det_ms": det_ms, "ocr_ms": ocr_ms})
+            out.append(plates)
+        return out
+
     def detect_plate(self, file_path):
         """Trả (crop_tk, text, vis_tk, conf)."""
         if not file_path:
             messagebox.showwarning("Cảnh báo", "Chưa chọn ảnh!")
             return None, "", None, 0.0
 
-        img = cv2.imread(file_path)
+        img = ImageFrame.open(file_path)
         if img is None:
             messagebox.showerror("Lỗi", "Không đọc được ảnh!")
             return None, "", None, 0.0
 
-        det = self.detector.predict(source=img, conf=0.18, device='cpu', verbose=False)[0]
-        if len(det.boxes) == 0:
+        with metrics.span(stage="detect_plate"):
+            plates = self.recognize_all(img)
+        if not plates:
             messagebox.showinfo("Thông báo", "Không phát hiện biển số!")
             return None, "", None, 0.0
 
-        i = int(det.boxes.conf.argmax())
-        x1, y1, x2, y2 = map(int, det.boxes.xyxy[i].tolist())
-        conf = float(det.boxes.conf[i])
-
-        # crop + nới 12%
-        h, w = img.shape[:2]
-        dw, dh = int((x2-x1)*0.12), int((y2-y1)*0.12)
-        x1 = max(0, x1-dw); y1 = max(0, y1-dh)
-        x2 = min(w-1, x2+dw); y2 = min(h-1, y2+dh)
-        plate = img[y1:y2, x1:x2]
-        self._last_crop_bgr = plate.copy()
-
-        # preprocess gọn
-        g = cv2.cvtColor(plate, cv2.COLOR_BGR2GRAY)
-        g = cv2.createCLAHE(2.0, (8,8)).apply(g)
-        thr = cv2.adaptiveThreshold(g,255,cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                    cv2.THRESH_BINARY,31,10)
-
-        res = self.reader.readtext(
-            thr, detail=1,
-            allowlist='0123456789ABCDEFGHJKLMNPRSTUVWXYZ-. ',
-            paragraph=False, text_threshold=0.55, low_text=0.3, link_threshold=0.3
-        )
-        raw = " ".join([t[1] for t in res]) if res else ""
-        text = _format_from_raw(raw) if raw else ""
-
-        # ảnh hiển thị
-        crop_tk = _cv2_to_tk(plate, (640,400), upscale=True)
-        vis = img.copy()
-        cv2.rectangle(vis, (x1,y1), (x2,y2), (0,255,0), 2)
-        cv2.putText(vis, text, (x1, max(0,y1-10)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2, cv2.LINE_AA)
-        vis_tk = _cv2_to_tk(vis, (480,350), upscale=False)
+        r = plates[0]
+        self._last_crop_bgr = r["crop"].copy()
+        self._last_plates = plates
+        crop_tk, vis_tk = self.render(img, plates)
+        return crop_tk, r["text"], vis_tk, r["conf"]
 
-        return crop_tk, text, vis_tk, conf
+    def render(self, img, plates):
+        """Dựng (crop_tk, vis_tk): crop của biển đầu tiên + ảnh có mọi bbox.
+        img: BGR hoặc ImageFrame (vẽ thẳng trên bản đã thu nhỏ cỡ hiển thị).
+        Nhận 1 dict hoặc list dict từ recognize*. Chỉ gọi trên main thread của Tk."""
+        if isinstance(plates, dict):
+            plates = [plates]
+        crop_tk = _cv2_to_tk(plates[0]["crop"], (640,400), upscale=True)
+        k = 1.0
+        if isinstance(img, ImageFrame):
+            W, H = img.size()
+            k = min(480 / W, 350 / H, 1.0)
+            vis = img.resized(max(1, int(W * k)), max(1, int(H * k))).copy()
+        else:
+            vis = img.copy()
+        for r in plates:
+            x1, y1, x2, y2 = (int(v * k) for v in r["bbox"])
+            cv2.rectangle(vis, (x1,y1), (x2,y2), (0,255,0), 2)
+            cv2.putText(vis, r["text"], (x1, max(0,y1-10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2, cv2.LINE_AA)
+        vis_tk = _cv2_to_tk(vis, (480,350), upscale=False)
+        return crop_tk, vis_tk
 
     # === Lưu lịch sử (kèm ảnh) ===
-    def history(self, bien_so: str) -> int:
-        img_path = None
-        try:
-            if self._last_crop_bgr is not None:
-                safe = re.sub(r'[^A-Z0-9]', '', bien_so.upper())
-                fname = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe}.jpg"
-                fpath = HISTORY_DIR / fname
-                cv2.imwrite(str(fpath), self._last_crop_bgr)
-                img_path = str(fpath)
-        except Exception as e:
-            print("Save history image error:", e)
-        return sql.luu_lich_su(bien_so, img_path)
+    def history(self, bien_so: str, crop_bgr=None) -> int:
+        """Lưu biển + ảnh crop (mặc định crop gần nhất của detect_plate)."""
+        return save_history(bien_so, self._last_crop_bgr if crop_bgr is None else crop_bgr)
+
+    def history_all(self, plates=None) -> list[int]:
+        """Lưu mỗi biển 1 dòng lịch sử (mặc định: các biển của detect_plate gần nhất)."""
+        plates = self._last_plates if plates is None else plates
+        return [self.history(p["text"], p["crop"]) for p in plates if p["text"]]
 
 Controller = A_ctl
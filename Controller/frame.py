@@ -0,0 +1,122 @@
+from __future__ import annotations
+import hashlib
+import threading
+import cv2
+import numpy as np
+
+from Controller.cache import content_key
+
+# hệ số thu nhỏ -> cờ decode JPEG giảm cỡ ngay trong miền DCT (libjpeg scale 1/2, 1/4, 1/8)
+_REDUCED = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# ===== 1 ảnh dùng chung cho GUI + controller =====
+class ImageFrame:
+    """
+    Đọc byte file 1 lần, decode theo nhu cầu và giữ lại kết quả:
+    - reduced(f): bản 1/f (f = 2, 4, 8) — JPEG decode thẳng ở cỡ nhỏ, không qua ảnh đầy đủ
+    - resized(w, h) / scaled(max_side): bản nhỏ cho hiển thị và lượt quét detect
+    - full(): ảnh đủ độ phân giải, chỉ decode khi thật sự cần (cắt crop biển)
+    GUI (thread chính) và worker nhận diện dùng chung 1 object; mọi hàm an toàn đa luồng.
+    """
+    def __init__(self, data: np.ndarray | None = None, path: str | None = None, img=None):
+        self.path = path
+        self._data = data                 # byte file (np.uint8), None nếu tạo từ mảng
+        self._full = img
+        self._levels: dict[int, np.ndarray] = {}
+        self._key: str | None = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def open(cls, path) -> ImageFrame | None:
+        """None nếu không đọc / decode được."""
+        try:
+            data = np.fromfile(str(path), np.uint8)   # chịu được đường dẫn Unicode trên Windows
+        except OSError:
+            return None
+        return cls.from_bytes(data, str(path))
+
+    @classmethod
+    def from_bytes(cls, buf, path: str | None = None) -> ImageFrame | None:
+        """Byte file ảnh (vd nhận qua socket); None nếu không decode được."""
+        data = np.frombuffer(buf, np.uint8)
+        f = cls(data, path)
+        return f if data.size and f.reduced(8) is not None else None
+
+    @classmethod
+    def from_array(cls, img, path: str | None = None) -> ImageFrame:
+        return cls(path=path, img=img)
+
+    @property
+    def is_jpeg(self) -> bool:
+        return self._data is not None and self._data[:2].tobytes() == b"\xff\xd8"
+
+    def key(self) -> str:
+        """Hash nội dung (byte file, hoặc pixel nếu tạo từ mảng) cho RecognitionCache."""
+        if self._key is None:
+            if self._data is not None:
+                self._key = hashlib.blake2b(self._data.data, digest_size=16).hexdigest()
+            else:
+                self._key = content_key(self._full)
+        return self._key
+
+    def encoded(self) -> bytes:
+        """Byte file để gửi đi: byte gốc nếu có, tạo từ mảng thì encode PNG (không mất mát)."""
+        if self._data is not None:
+            return self._data.tobytes()
+        ok, buf = cv2.imencode(".png", self._full, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        if not ok:
+            raise ValueError("imencode lỗi")
+        return buf.tobytes()
+
+    def full(self) -> np.ndarray | None:
+        with self._lock:
+            if self._full is None and self._data is not None:
+                self._full = cv2.imdecode(self._data, cv2.IMREAD_COLOR)
+            return self._full
+
+    def size(self) -> tuple[int, int]:
+        """(w, h) ảnh gốc. Chưa decode đầy đủ thì ước lượng từ bản 1/8 (sai < 8px)."""
+        with self._lock:
+            if self._full is None and self.is_jpeg:
+                h, w = self.reduced(8).shape[:2]
+                return w * 8, h * 8
+            h, w = self.full().shape[:2]
+            return w, h
+
+    def reduced(self, f: int) -> np.ndarray | None:
+        if f == 1:
+            return self.full()
+        with self._lock:
+            img = self._levels.get(f)
+            if img is None:
+                if self._full is None and self.is_jpeg:
+                    img = cv2.imdecode(self._data, _REDUCED[f])
+                else:                       # không phải JPEG / đã có ảnh gốc -> thu nhỏ từ ảnh gốc
+                    full = self.full()
+                    if full is None:
+                        return None
+                    h, w = full.shape[:2]
+                    img = cv2.resize(full, (max(1, -(-w // f)), max(1, -(-h // f))),
+                                     interpolation=cv2.INTER_AREA)
+                self._levels[f] = img
+            return img
+
+    def resized(self, w: int, h: int) -> np.ndarray:
+        """Ảnh đúng cỡ (w, h), decode từ mức thu nhỏ sâu nhất còn >= (w, h). Không sửa kết quả trả về."""
+        W, H = self.size()
+        f = next((f for f in (8, 4, 2) if W // f >= w and H // f >= h), 1)
+        base = self.reduced(f)
+        if base.shape[1] == w and base.shape[0] == h:
+            return base
+        return cv2.resize(base, (w, h), interpolation=cv2.INTER_AREA)
+
+    def scaled(self, max_side: int) -> np.ndarray:
+        """Giữ tỉ lệ, cạnh dài = max_side (không phóng to)."""
+        W, H = self.size()
+        s = min(1.0, max_side / max(W, H))
+        if s == 1.0:
+            return self.full()
+        return self.resized(max(1, round(W * s)), max(1, round(H * s)))
+
+def as_frame(x) -> ImageFrame:
+    return x if isinstance(x, ImageFrame) else ImageFrame.from_array(x)
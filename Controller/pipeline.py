@@ -0,0 +1,240 @@
+from __future__ import annotations
+import multiprocessing as mp
+import os
+import queue
+import threading
+import itertools
+import time
+from multiprocessing import shared_memory
+from pathlib import Path
+import cv2
+import numpy as np
+
+from Controller.ctl import (DET_CONF, MULTI_CONF, MODEL_DIR, RUNS_DIR, _expand_box,
+                            _find_latest_best, _ocr_crops, _snap)
+from Controller.frame import ImageFrame
+
+MIN_FRAME_SLOT_MB = 8
+
+# ===== Ring buffer trên shared memory =====
+class ShmRing:
+    """
+    n_slots ô kích thước cố định trong 1 SharedMemory. Chỉ số ô rảnh đi qua 1 mp.Queue:
+    hết ô thì bên ghi phải chờ (backpressure). Ảnh lớn hơn 1 ô thì gửi kiểu pickle như cũ
+    (queue nhận phải có maxsize để số ảnh pickle đang chờ cũng bị chặn).
+    Pickle object này sang tiến trình con -> con tự attach lại theo tên.
+    """
+    def __init__(self, ctx, n_slots: int, slot_bytes: int):
+        self.n_slots, self.slot_bytes = n_slots, slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * slot_bytes)
+        self.name = self.shm.name
+        self.free = ctx.Queue()
+        for i in range(n_slots):
+            self.free.put(i)
+        self._owner = True
+
+    def __getstate__(self):
+        return {"n_slots": self.n_slots, "slot_bytes": self.slot_bytes,
+                "name": self.name, "free": self.free}
+
+    def __setstate__(self, st):
+        self.__dict__.update(st)
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, track=False)  # Python >= 3.13
+        except TypeError:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+        self._owner = False
+
+    def pack(self, arr):
+        """-> ("shm", slot, shape, dtype) hoặc ("raw", arr) nếu không vừa 1 ô."""
+        if arr.nbytes > self.slot_bytes:
+            return ("raw", arr)
+        slot = self.free.get()
+        np.ndarray(arr.shape, arr.dtype, buffer=self.shm.buf,
+                   offset=slot * self.slot_bytes)[...] = arr
+        return ("shm", slot, arr.shape, arr.dtype.str)
+
+    def view(self, packed):
+        """Mảng trỏ thẳng vào shared memory (không copy); hợp lệ tới khi release()."""
+        if packed[0] == "raw":
+            return packed[1]
+        _, slot, shape, dt = packed
+        return np.ndarray(shape, np.dtype(dt), buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def release(self, packed):
+        if packed[0] == "shm":
+            self.free.put(packed[1])
+
+    def close(self):
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+# ===== Các stage (mỗi stage 1 hoặc nhiều tiến trình) =====
+def _decode_worker(paths_q, det_q, frames: ShmRing):
+    cv2.setNumThreads(1)
+    while (p := paths_q.get()) is not None:
+        img = cv2.imread(p)
+        if img is None:
+            det_q.put(("err", p, "decode")); continue
+        det_q.put(("frame", p, frames.pack(img)))
+    det_q.put(("done",))
+
+def _detect_worker(model_path, backend, det_q, ocr_q, res_q, frames: ShmRing, crops: ShmRing,
+                   n_decode: int, n_ocr: int, batch: int, threads: int):
+    from Controller.backend import load_detector
+    import torch
+    torch.set_num_threads(threads)
+    model, device = load_detector(Path(model_path), backend)
+    done = 0
+    while done < n_decode:
+        msgs = [det_q.get()]
+        while len(msgs) < batch:                 # gom frame đang chờ để predict theo lô
+            try:
+                msgs.append(det_q.get_nowait())
+            except queue.Empty:
+                break
+        todo = []
+        for m in msgs:
+            if m[0] == "done":
+                done += 1
+            elif m[0] == "err":
+                res_q.put({"file": m[1], "error": m[2]})
+            else:
+                todo.append(m)
+        if not todo:
+            continue
+
+        imgs = [frames.view(m[2]) for m in todo]
+        t0 = time.perf_counter()
+        dets = model.predict(source=imgs, conf=DET_CONF, device=device, verbose=False)
+        det_ms = (time.perf_counter() - t0) * 1000 / len(imgs)
+        for m, img, det in zip(todo, imgs, dets):
+            confs, xyxy = det.boxes.conf.tolist(), det.boxes.xyxy.tolist()
+            order = sorted(range(len(confs)), key=lambda i: -confs[i])
+            keep = [i for rank, i in enumerate(order) if rank == 0 or confs[i] >= MULTI_CONF]
+            if not keep:
+                res_q.put({"file": m[1], "error": "no_plate", "det_ms": det_ms})
+            for k, i in enumerate(keep):
+                bbox, crop = _expand_box(img, xyxy[i])
+                meta = {"file": m[1], "plate_idx": k, "conf": confs[i], "bbox": list(bbox),
+                        "det_ms": det_ms}
+                ocr_q.put((meta, crops.pack(np.ascontiguousarray(crop))))
+            frames.release(m[2])                  # crop đã chép sang ring crop
+    for _ in range(n_ocr):
+        ocr_q.put(None)
+    res_q.put(None)          # sentinel riêng: bản ghi no_plate / lỗi decode ghi thẳng vào res_q
+
+def _ocr_worker(ocr_q, res_q, crops: ShmRing, with_crop: bool, known: bool):
+    cv2.setNumThreads(1)
+    import torch
+    torch.set_num_threads(1)                      # mỗi tiến trình 1 lõi -> scale theo số lõi
+    import easyocr
+    reader = easyocr.Reader(['en'], gpu=False)
+    index = None
+    if known:                                     # ảnh chụp lúc khởi động; tiến trình chính mới ghi DB
+        from Model.plate_index import PlateIndex
+        index = PlateIndex.from_db(watch=False)
+    while (m := ocr_q.get()) is not None:
+        meta, packed = m
+        crop = crops.view(packed).copy()
+        crops.release(packed)
+        t0 = time.perf_counter()
+        try:                                      # cùng cách đọc với A_ctl (nhị phân hoá + đọc theo dòng)
+            text, raw, _, omin = _ocr_crops(reader, [crop])[0]
+            meta.update(text=_snap(index, text, raw, omin), raw=raw)
+        except Exception as e:                    # 1 crop lỗi không làm chết cả tiến trình
+            meta.update(text="", raw="", error=str(e))
+        meta["ocr_ms"] = (time.perf_counter() - t0) * 1000
+        if with_crop:
+            meta["crop"] = crop
+        res_q.put(meta)
+    res_q.put(None)
+
+# ===== Pipeline =====
+class Pipeline:
+    """
+    decode (n_decode tiến trình) -> detect (1 tiến trình, predict theo lô) -> OCR (n_ocr tiến trình,
+    mỗi tiến trình 1 EasyOCR reader). Frame và crop đi qua ring buffer shared memory.
+    frame_slot_mb=None: cỡ 1 ô frame lấy theo ảnh đầu tiên (tối thiểu MIN_FRAME_SLOT_MB);
+    ảnh nào lớn hơn 1 ô (vd thư mục trộn nhiều độ phân giải) vẫn chạy nhưng đi qua pickle.
+    run(paths) sinh kết quả theo từng biển (thứ tự xong trước ra trước):
+    {file, plate_idx, text, raw, conf, bbox, det_ms, ocr_ms} hoặc {file, error}
+    (lỗi OCR 1 crop: bản ghi của biển đó có error và text rỗng).
+    """
+    def __init__(self, model_path=None, backend=None, n_decode: int = 2, n_ocr: int | None = None,
+                 det_batch: int = 8, det_threads: int = 2, frame_slots: int = 16,
+                 frame_slot_mb: int | None = None, crop_slots: int = 64, crop_slot_kb: int = 512,
+                 with_crop: bool = False, known_plates: bool = True):
+        mp_ = Path(model_path) if model_path else (_find_latest_best(RUNS_DIR) or (MODEL_DIR / "best.pt"))
+        if not mp_ or not mp_.exists():
+            raise FileNotFoundError("Không tìm thấy best.pt")
+        self.model_path = mp_
+        self.backend = backend
+        self.n_decode = n_decode
+        self.n_ocr = n_ocr or max(1, (os.cpu_count() or 2) - n_decode - det_threads)
+        self.det_batch, self.det_threads = det_batch, det_threads
+        self.frame_slots = frame_slots
+        self.frame_slot_mb = frame_slot_mb
+        self.crop_ring = (crop_slots, crop_slot_kb << 10)
+        self.with_crop = with_crop
+        self.known_plates = known_plates
+
+    def _frame_slot_bytes(self, first) -> int:
+        if self.frame_slot_mb is not None:
+            return self.frame_slot_mb << 20
+        f = ImageFrame.open(first) if first is not None else None
+        w, h = f.size() if f is not None else (0, 0)
+        # size() của JPEG ước lượng từ bản 1/8 (sai < 8px) -> chừa thêm 8px mỗi chiều
+        return max(MIN_FRAME_SLOT_MB << 20, (w + 8) * (h + 8) * 3)
+
+    def run(self, paths):
+        ctx = mp.get_context("spawn")
+        paths = iter(paths)
+        first = next(paths, None)
+        if first is not None:
+            paths = itertools.chain([first], paths)
+        frames = ShmRing(ctx, self.frame_slots, self._frame_slot_bytes(first))
+        crops = ShmRing(ctx, *self.crop_ring)
+        # det_q có giới hạn: ảnh lớn hơn 1 ô (đi pickle) cũng không dồn vô hạn trong RAM
+        paths_q, det_q = ctx.Queue(maxsize=4 * self.frame_slots), ctx.Queue(maxsize=self.frame_slots)
+        ocr_q, res_q = ctx.Queue(), ctx.Queue()
+
+        procs = [ctx.Process(target=_decode_worker, args=(paths_q, det_q, frames), daemon=True)
+                 for _ in range(self.n_decode)]
+        procs.append(ctx.Process(target=_detect_worker, daemon=True, args=(
+            str(self.model_path), self.backend, det_q, ocr_q, res_q, frames, crops,
+            self.n_decode, self.n_ocr, self.det_batch, self.det_threads)))
+        procs += [ctx.Process(target=_ocr_worker, daemon=True,
+                              args=(ocr_q, res_q, crops, self.with_crop, self.known_plates))
+                  for _ in range(self.n_ocr)]
+        for p in procs:
+            p.start()
+
+        def feed():
+            for p in paths:
+                paths_q.put(str(p))
+            for _ in range(self.n_decode):
+                paths_q.put(None)
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        finished = 0
+        try:
+            while finished < self.n_ocr + 1:            # n_ocr worker OCR + tiến trình detect
+                try:
+                    r = res_q.get(timeout=1.0)
+                except queue.Empty:
+                    dead = [p for p in procs if p.exitcode not in (None, 0)]
+                    if dead:
+                        raise RuntimeError(f"Tiến trình pipeline lỗi (exitcode {dead[0].exitcode})")
+                    continue
+                if r is None:
+                    finished += 1
+                else:
+                    yield r
+        finally:
+            for p in procs:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+            frames.close(); crops.close()
@@ -0,0 +1,169 @@
+from __future__ import annotations
+import itertools
+import json
+import os
+import socket
+import struct
+import threading
+
+from Controller.ctl import A_ctl
+from Controller.frame import as_frame
+
+# ===== Giao thức =====
+# Mỗi message: header ">II" (độ dài JSON, độ dài blob) + JSON (utf-8) + blob (byte file ảnh).
+# client -> server: {"op": "hello"|"recognize"|"read", "id": n} (+ ảnh với recognize, crop biển với read)
+# server -> client: {"id": n, "plates": [...]} | {"id": n, "read": {text, raw, ocr_conf}}
+#                 | {"id": n, "ready": bool, "error": str|None} | {"id": n, "error": str}
+DEFAULT_ADDR = os.getenv("BTL_SERVER", "127.0.0.1:8765")
+MAX_MSG = 64 << 20          # chặn message lỗi / quá lớn làm phình RAM
+_HDR = struct.Struct(">II")
+
+def parse_address(address: str):
+    """'host:port' -> TCP, 'unix:/đường/dẫn.sock' -> Unix socket. Trả (family, addr)."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+def connect(address: str, timeout: float | None = None) -> socket.socket:
+    fam, addr = parse_address(address)
+    s = socket.socket(fam, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(addr)
+    except OSError:
+        s.close()
+        raise
+    if fam == socket.AF_INET:
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return s
+
+def send_msg(sock: socket.socket, obj: dict, blob: bytes = b""):
+    js = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HDR.pack(len(js), len(blob)) + js)
+    if blob:
+        sock.sendall(blob)
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray | None:
+    buf = bytearray(n)
+    view, got = memoryview(buf), 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            if got == 0:
+                return None
+            raise ConnectionError("Kết nối bị đóng giữa message")
+        got += k
+    return buf
+
+def recv_msg(sock: socket.socket) -> tuple[dict, bytearray] | None:
+    """(obj, blob), hoặc None nếu phía kia đã đóng kết nối."""
+    hdr = _recv_exact(sock, _HDR.size)
+    if hdr is None:
+        return None
+    n_js, n_blob = _HDR.unpack(hdr)
+    if n_js + n_blob > MAX_MSG:
+        raise ConnectionError(f"Message quá lớn ({n_js + n_blob} byte)")
+    js = _recv_exact(sock, n_js) if n_js else bytearray()
+    blob = _recv_exact(sock, n_blob) if n_blob else bytearray()
+    if js is None or blob is None:
+        raise ConnectionError("Kết nối bị đóng giữa message")
+    return json.loads(js.decode("utf-8")), blob
+
+# ===== Client: controller chạy nhờ model của server.py =====
+class RemoteController:
+    """
+    Thay A_ctl cho Mainview / RecognitionWorker khi YOLO + EasyOCR nằm ở server.py
+    (nhiều máy trạm dùng chung 1 bộ model). Chỉ gửi byte ảnh và nhận bbox/text;
+    crop được cắt lại từ ảnh tại chỗ, lịch sử vẫn lưu vào CSDL của máy trạm.
+    ready / load_error giống A_ctl: set khi server báo model đã nạp xong.
+    """
+    def __init__(self, address: str | None = None, timeout: float = 60.0):
+        self.address = address or DEFAULT_ADDR
+        self.timeout = timeout
+        self._last_crop_bgr = None
+        self._last_plates = []
+        self._sock: socket.socket | None = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.load_error: Exception | None = None
+        self.ready = threading.Event()
+        threading.Thread(target=self._hello, name="remote-hello", daemon=True).start()
+
+    def _hello(self):
+        try:
+            r = self._call([({"op": "hello"}, b"")], timeout=None)[0]   # server còn nạp model thì chờ
+            if not r.get("ready"):
+                self.load_error = RuntimeError(r.get("error") or "server chưa sẵn sàng")
+        except Exception as e:
+            self.load_error = e
+        finally:
+            self.ready.set()
+
+    def _call(self, msgs: list[tuple[dict, bytes]], timeout: float | None = -1) -> list[dict]:
+        """Gửi liền mọi request rồi mới đọc trả lời (server gom chung vào 1 lô).
+        Lỗi kết nối -> đóng socket, lần gọi sau tự kết nối lại."""
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._sock = connect(self.address, self.timeout)
+                self._sock.settimeout(self.timeout if timeout == -1 else timeout)
+                ids = []
+                for obj, blob in msgs:
+                    ids.append(next(self._ids))
+                    send_msg(self._sock, dict(obj, id=ids[-1]), blob)
+                got = {}
+                while len(got) < len(ids):
+                    msg = recv_msg(self._sock)
+                    if msg is None:
+                        raise ConnectionError("server đã đóng kết nối")
+                    got[msg[0].get("id")] = msg[0]
+                return [got[i] for i in ids]
+            except (OSError, ValueError) as e:
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                raise ConnectionError(f"Lỗi kết nối server {self.address}: {e}") from e
+
+    def recognize_all_batch(self, imgs) -> list[list[dict]]:
+        if not imgs:
+            return []
+        frames = [as_frame(x) for x in imgs]
+        self._wait_ready()
+        out = []
+        for f, r in zip(frames, self._call([({"op": "recognize"}, f.encoded()) for f in frames])):
+            if r.get("error"):
+                raise RuntimeError(r["error"])
+            plates = []
+            for p in r["plates"]:
+                x1, y1, x2, y2 = p["bbox"]
+                plates.append(dict(p, crop=f.full()[y1:y2, x1:x2]))
+            out.append(plates)
+        return out
+
+    def read_crops(self, crops) -> list[dict]:
+        if not len(crops):
+            return []
+        self._wait_ready()
+        out = []
+        for r in self._call([({"op": "read"}, as_frame(c).encoded()) for c in crops]):
+            if r.get("error"):
+                raise RuntimeError(r["error"])
+            out.append(r["read"])
+        return out
+
+    # phần không đụng tới model: dùng nguyên hàm của A_ctl
+    _wait_ready = A_ctl._wait_ready
+    recognize = A_ctl.recognize
+    recognize_all = A_ctl.recognize_all
+    recognize_batch = A_ctl.recognize_batch
+    home = A_ctl.home
+    render = A_ctl.render
+    history = A_ctl.history
+    history_all = A_ctl.history_all
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import atexit
+import os
+import queue
+import threading
+from pathlib import Path
+import cv2
+
+from Controller.cache import content_key
+import metrics
+
+# ===== Thumbnail =====
+# size -> khung tối đa (w, h): "s" cho dòng HistoryWindow, "m" cho ImageViewer
+THUMBS = {"s": (96, 32), "m": (820, 500)}
+THUMB_DIR = Path(__file__).resolve().parents[1] / ".thumbs"
+
+def thumb_path(path, size: str) -> Path:
+    """.thumbs/<size>/<tên file ảnh gốc>; ảnh đã vừa khung thì không có thumbnail (dùng ảnh gốc)."""
+    return THUMB_DIR / size / Path(path).name
+
+def _write_jpg(path: Path, img, quality: int):
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("imencode lỗi")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_bytes(buf.tobytes())
+    os.replace(tmp, path)          # không bao giờ lộ file ghi dở
+
+# ===== Kho ảnh lịch sử theo nội dung =====
+class ImageStore:
+    """
+    Mỗi crop lưu đúng 1 lần tại <root>/<2 ký tự đầu hash>/<hash>.jpg (hash = pixel + shape),
+    các dòng lichsu đọc cùng 1 xe trỏ chung 1 file qua ImagePath.
+    put() trả đường dẫn ngay; encode JPEG + ghi file + thumbnail (THUMBS) nằm ở thread nền
+    (hàng đợi có giới hạn -> ghi không kịp thì put() chờ).
+    """
+    def __init__(self, root: Path, quality: int = 90, max_pending: int = 256):
+        self.root = Path(root)
+        self.quality = quality
+        self._q: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._pending: dict[str, object] = {}     # path -> ảnh chưa ghi xong
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="image-store", daemon=True)
+        self._thread.start()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.jpg"
+
+    def put(self, img) -> str:
+        path = self.path_for(content_key(img))
+        sp = str(path)
+        with self._lock:
+            if sp in self._pending or path.exists():
+                metrics.inc("btl_image_store_total", result="dedup")
+                return sp
+            self._pending[sp] = img = img.copy()   # crop thường là view của frame gốc
+        metrics.inc("btl_image_store_total", result="new")
+        self._q.put((path, img))
+        return sp
+
+    def pending(self, path) -> object | None:
+        """Ảnh đã put() nhưng chưa ghi xuống đĩa (để đọc lại ngay), hoặc None."""
+        with self._lock:
+            return self._pending.get(str(path))
+
+    def _run(self):
+        while (item := self._q.get()) is not None:
+            path, img = item
+            try:
+                with metrics.span(stage="image_store_write"):
+                    for size, (tw, th) in THUMBS.items():   # thumbnail trước, ảnh gốc sau cùng
+                        h, w = img.shape[:2]
+                        scale = min(tw / w, th / h)
+                        if scale < 1.0:
+                            small = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                               interpolation=cv2.INTER_AREA)
+                            _write_jpg(thumb_path(path, size), small, self.quality)
+                    _write_jpg(path, img, self.quality)
+            except Exception as e:
+                print("Save history image error:", e)
+            finally:
+                with self._lock:
+                    self._pending.pop(str(path), None)
+                self._q.task_done()
+        self._q.task_done()
+
+    def flush(self):
+        """Chờ ghi xong mọi ảnh đang đợi."""
+        self._q.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join()
+
+_STORE: ImageStore | None = None
+_STORE_LOCK = threading.Lock()
+
+def get_store(root: Path) -> ImageStore:
+    """Kho dùng chung cho cả tiến trình; thoát chương trình thì ghi nốt rồi mới đóng."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ImageStore(root)
+            atexit.register(_STORE.close)
+        return _STORE
+
+def pending_image(path):
+    """Ảnh BGR đã put() vào kho của tiến trình này nhưng chưa ghi xong xuống đĩa, hoặc None."""
+    store = _STORE
+    return store.pending(path) if store is not None else None
@@ -0,0 +1,95 @@
+from __future__ import annotations
+from collections import defaultdict
+
+# ===== Tracker IoU/tâm cho box biển số qua các frame =====
+def iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2-ix1) * max(0, iy2-iy1)
+    if inter == 0:
+        return 0.0
+    area = lambda r: (r[2]-r[0]) * (r[3]-r[1])
+    return inter / float(area(a) + area(b) - inter)
+
+def _center_close(a, b, ratio=0.5) -> bool:
+    """Tâm 2 box cách nhau < ratio * đường chéo box a (xe chạy nhanh, IoU = 0)."""
+    ca = ((a[0]+a[2])/2, (a[1]+a[3])/2); cb = ((b[0]+b[2])/2, (b[1]+b[3])/2)
+    diag = ((a[2]-a[0])**2 + (a[3]-a[1])**2) ** 0.5
+    return ((ca[0]-cb[0])**2 + (ca[1]-cb[1])**2) ** 0.5 < ratio * diag
+
+class Track:
+    def __init__(self, tid: int, bbox, conf: float, frame: int):
+        self.id = tid
+        self.bbox = bbox
+        self.conf = conf
+        self.first_frame = self.last_frame = frame
+        self.hits = 1
+        self.missed = 0
+        self.last_ocr = -10**9
+        self.reads: list[tuple[str, float]] = []   # (text, trọng số)
+        self.best_crop = None                      # crop có conf detect cao nhất
+        self.best_conf = -1.0
+
+class IouTracker:
+    """Ghép box theo IoU tham lam, hụt IoU thì thử khoảng cách tâm.
+    Track mất dấu quá max_missed frame thì coi như xe đã đi qua."""
+    def __init__(self, iou_thr=0.3, max_missed=15):
+        self.iou_thr = iou_thr
+        self.max_missed = max_missed
+        self.tracks: list[Track] = []
+        self._next_id = 1
+
+    def update(self, boxes, frame: int):
+        """boxes: [(xyxy, conf)] -> (track đang sống, track vừa kết thúc)."""
+        pairs = sorted(((iou(t.bbox, b[0]), ti, bi)
+                        for ti, t in enumerate(self.tracks)
+                        for bi, b in enumerate(boxes)), reverse=True)
+        used_t, used_b = set(), set()
+        for sc, ti, bi in pairs:
+            if ti in used_t or bi in used_b:
+                continue
+            if sc < self.iou_thr and not _center_close(self.tracks[ti].bbox, boxes[bi][0]):
+                continue
+            used_t.add(ti); used_b.add(bi)
+            t = self.tracks[ti]
+            t.bbox, t.conf = boxes[bi]
+            t.hits += 1; t.missed = 0; t.last_frame = frame
+
+        for ti, t in enumerate(self.tracks):
+            if ti not in used_t:
+                t.missed += 1
+        for bi, (bbox, conf) in enumerate(boxes):
+            if bi not in used_b:
+                self.tracks.append(Track(self._next_id, bbox, conf, frame))
+                self._next_id += 1
+
+        done = [t for t in self.tracks if t.missed > self.max_missed]
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        return [t for t in self.tracks if t.missed == 0], done
+
+    def flush(self):
+        """Kết thúc mọi track (hết video)."""
+        done, self.tracks = self.tracks, []
+        return done
+
+# ===== Bỏ phiếu theo ký tự =====
+def vote_chars(reads) -> tuple[str, float]:
+    """reads: [(text chuẩn hoá, trọng số)] -> (text, tỉ lệ phiếu trung bình).
+    Chọn độ dài có tổng trọng số lớn nhất rồi bầu từng vị trí ký tự."""
+    reads = [(t, w) for t, w in reads if t]
+    if not reads:
+        return "", 0.0
+    by_len = defaultdict(float)
+    for t, w in reads:
+        by_len[len(t)] += w
+    L = max(by_len, key=by_len.get)
+    same = [(t, w) for t, w in reads if len(t) == L]
+    total = sum(w for _, w in same) or 1.0
+    out, agree = [], 0.0
+    for i in range(L):
+        votes = defaultdict(float)
+        for t, w in same:
+            votes[t[i]] += w
+        ch = max(votes, key=votes.get)
+        out.append(ch); agree += votes[ch] / total
+    return "".join(out), agree / L
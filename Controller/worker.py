@@ -0,0 +1,104 @@
+from __future__ import annotations
+import itertools
+import queue
+import threading
+
+from Controller.frame import ImageFrame
+
+# ===== Worker nhận diện chạy nền cho GUI =====
+class RecognitionWorker:
+    """
+    Chạy A_ctl.recognize_all (+ lưu lịch sử mỗi biển 1 dòng) trên 1 thread nền.
+    GUI gọi submit() rồi poll() định kỳ bằng window.after(); không có Tk object nào
+    được tạo ở thread này (PhotoImage phải dựng trên main thread).
+    """
+    def __init__(self, controller, save_history=True):
+        self.ctl = controller
+        self.save_history = save_history
+        self.jobs: queue.Queue = queue.Queue()
+        self.results: queue.Queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._cancelled: set[int] = set()   # chỉ chứa id đang chờ / đang chạy, bỏ ra khi tới lượt
+        self._queued: set[int] = set()
+        self._lock = threading.Lock()
+        self.current = None          # id job đang chạy
+        self._thread = threading.Thread(target=self._run, name="recognition-worker", daemon=True)
+        self._thread.start()
+
+    # --- API cho GUI ---
+    def submit(self, file_path) -> int:
+        """file_path: đường dẫn, hoặc ImageFrame GUI đã mở sẵn (dùng chung, không decode lại)."""
+        with self._lock:
+            job_id = next(self._ids)
+            self._queued.add(job_id)
+            self.jobs.put((job_id, file_path))
+        return job_id
+
+    def cancel(self, job_id: int | None = None):
+        """Huỷ 1 job (hoặc tất cả nếu None). Job đang chạy thì bỏ kết quả;
+        id đã xong / không tồn tại thì bỏ qua."""
+        with self._lock:
+            if job_id is not None:
+                if job_id in self._queued or job_id == self.current:
+                    self._cancelled.add(job_id)
+                return
+            while True:                           # lấy khỏi queue luôn, không cần đánh dấu
+                try:
+                    jid, _ = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                self._queued.discard(jid)
+                self._cancelled.discard(jid)
+            if self.current is not None:
+                self._cancelled.add(self.current)
+
+    def pending(self) -> int:
+        """Số job chưa xong (đang chờ + đang chạy)."""
+        return self.jobs.qsize() + (1 if self.current is not None else 0)
+
+    def poll(self) -> list[dict]:
+        """Lấy mọi kết quả đã xong: {job, file, img (ImageFrame), plates, error}."""
+        out = []
+        while True:
+            try:
+                out.append(self.results.get_nowait())
+            except queue.Empty:
+                return out
+
+    def stop(self):
+        self.cancel()
+        self.jobs.put(None)
+
+    # --- thread nền ---
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            job_id, src = job
+            file_path = src.path if isinstance(src, ImageFrame) else src
+            with self._lock:
+                self._queued.discard(job_id)
+                if job_id in self._cancelled:
+                    self._cancelled.discard(job_id); continue
+                self.current = job_id
+            out = {"job": job_id, "file": file_path, "img": None, "plates": [], "error": None}
+            try:
+                img = src if isinstance(src, ImageFrame) else ImageFrame.open(file_path)
+                if img is None:
+                    out["error"] = "Không đọc được ảnh!"
+                else:
+                    out["img"] = img
+                    plates = self.ctl.recognize_all(img)
+                    if self.save_history and job_id not in self._cancelled:
+                        for p in plates:
+                            if p["text"]:
+                                p["id"] = self.ctl.history(p["text"], p["crop"])
+                    out["plates"] = plates
+            except Exception as e:
+                out["error"] = str(e)
+            with self._lock:
+                self.current = None
+                if job_id in self._cancelled:
+                    self._cancelled.discard(job_id); continue
+            self.results.put(out)
@@ -2,9 +2,13 @@ from __future__ import annotations
 from tkinter import *
 from tkinter import messagebox, filedialog, ttk
 from PIL import Image, ImageTk
+import cv2
 import re
 from pathlib import Path
 from Model.Data import sql
+from Controller.frame import ImageFrame
+from Controller.worker import RecognitionWorker
+from GUI.thumbs import ThumbLoader, thumbs
 
 # ==== regex để tách tỉnh/seri/mã cá nhân từ text đã format ====
 PLATE_CANON = re.compile(r'^([1-9]\d)([A-Z]{1,2})(\d)(\d{4,5})$')
@@ -30,29 +34,46 @@ class ImageViewer(Toplevel):
         self.title(title)
         self.geometry("860x560")
         self.resizable(True, True)
-        p = Path(img_path)
-        if not p.exists():
+        # thumbnail cỡ "m" (đã vừa cửa sổ), không decode + resize ảnh gốc mỗi lần mở
+        self.tk_img = thumbs().get(img_path, "m")
+        if self.tk_img is None:
             messagebox.showinfo("Thông báo", "Không tìm thấy ảnh đã lưu.")
             self.destroy(); return
-        img = Image.open(p)
-        # co ảnh cho vừa cửa sổ
-        w, h = img.size; max_w, max_h = 820, 500
-        scale = min(max_w / w, max_h / h, 1.0)
-        if scale < 1.0:
-            img = img.resize((int(w*scale), int(h*scale)), Image.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(img)
         Label(self, image=self.tk_img, bg="white").pack(padx=12, pady=12, expand=True)
 
 # ==== Cửa sổ Lịch sử ====
 class HistoryWindow(Toplevel):
+    PAGE = 200   # số dòng mỗi lần nạp thêm khi cuộn
+    POLL_MS = 50 # chu kỳ lấy thumbnail đã decode xong
+
     def __init__(self, master):
         super().__init__(master)
         self.title("Lịch sử biển số đã đọc")
-        self.geometry("980x560")
+        self.geometry("980x600")
         self.resizable(True, True)
 
+        # bộ lọc
+        ff = Frame(self); ff.pack(fill="x", padx=10, pady=(10, 0))
+        self.var_plate = StringVar(); self.var_tinh = StringVar()
+        self.var_tu = StringVar(); self.var_den = StringVar()
+        Label(ff, text="Biển số:").pack(side="left")
+        ttk.Entry(ff, textvariable=self.var_plate, width=12).pack(side="left", padx=(2, 10))
+        Label(ff, text="Tỉnh:").pack(side="left")
+        ttk.Combobox(ff, textvariable=self.var_tinh, width=16,
+                     values=[""] + sql.ds_tinh()).pack(side="left", padx=(2, 10))
+        Label(ff, text="Từ:").pack(side="left")
+        ttk.Entry(ff, textvariable=self.var_tu, width=11).pack(side="left", padx=(2, 10))
+        Label(ff, text="Đến:").pack(side="left")
+        ttk.Entry(ff, textvariable=self.var_den, width=11).pack(side="left", padx=(2, 10))
+        ttk.Button(ff, text="Lọc", command=self.reload).pack(side="left")
+
+        tf = Frame(self); tf.pack(fill="both", expand=True, padx=10, pady=10)
         cols = ("plate","ten_tinh","saved_at","image_path")
-        self.tree = ttk.Treeview(self, columns=cols, show="headings", height=18)
+        ttk.Style(self).configure("History.Treeview", rowheight=36)   # đủ cao cho thumbnail
+        self.tree = ttk.Treeview(tf, columns=cols, show="tree headings", height=14,
+                                 style="History.Treeview")
+        self.tree.heading("#0", text="Ảnh")
+        self.tree.column("#0", width=110, stretch=False, anchor="center")
         self.tree.heading("plate", text="Biển số")
         self.tree.heading("ten_tinh", text="Tỉnh thành")
         self.tree.heading("saved_at", text="Thời gian lưu")
@@ -61,12 +82,11 @@ class HistoryWindow(Toplevel):
         self.tree.column("ten_tinh", width=180, anchor="w")
         self.tree.column("saved_at", width=180, anchor="w")
         self.tree.column("image_path", width=420, anchor="w")
-        self.tree.pack(fill="both", expand=True, padx=10, pady=10)
-
-        # nạp dữ liệu
-        for r in sql.get_lich_su(limit=500):
-            self.tree.insert("", "end",
-                values=(r["BienSo"], r["TenTinh"], r["NgayGio"], r.get("ImagePath","")))
+        self._done, self._pending = True, False
+        self.sb = ttk.Scrollbar(tf, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self._on_scroll)
+        self.sb.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
 
         # hành động
         btnf = Frame(self); btnf.pack(fill="x", padx=10, pady=6)
@@ -76,6 +96,103 @@ class HistoryWindow(Toplevel):
         # double click mở ảnh
         self.tree.bind("<Double-1>", lambda e: self._open_selected())
 
+        # thumbnail decode ở thread nền, chỉ cho các dòng đang nhìn thấy
+        self._loader = ThumbLoader(thumbs())
+        self._imgs = {}           # iid -> PhotoImage (None = không có ảnh), chỉ các dòng đang hiện
+        self._requested = set()   # iid đã gửi cho loader, chưa có kết quả
+        self._thumbs_pending = False
+        self._poll_id = self.after(self.POLL_MS, self._poll_thumbs)
+        self.reload()
+
+    def destroy(self):
+        self.after_cancel(self._poll_id)
+        self._loader.stop()
+        super().destroy()
+
+    # --- nạp dữ liệu theo trang (keyset), chỉ nạp thêm khi cuộn gần cuối ---
+    def reload(self):
+        self.tree.delete(*self.tree.get_children())
+        self._loader.cancel()
+        self._imgs.clear(); self._requested.clear()
+        self._last_id = None
+        self._done = False
+        self._filters = dict(bien_so=self.var_plate.get(), tinh=self.var_tinh.get(),
+                             tu=self.var_tu.get(), den=self.var_den.get())
+        self._load_page()
+
+    def _load_page(self):
+        self._pending = False
+        if self._done:
+            return
+        rows = sql.tim_lich_su(limit=self.PAGE, truoc_id=self._last_id, **self._filters)
+        for r in rows:
+            path = r.get("ImagePath") or ""
+            self.tree.insert("", "end", text="…" if path else "",
+                values=(r["BienSo"], r["TenTinh"], r["NgayGio"], path))
+        if rows:
+            self._last_id = rows[-1]["ID"]
+        self._done = len(rows) < self.PAGE
+        self._schedule_thumbs()
+
+    def _on_scroll(self, first, last):
+        self.sb.set(first, last)
+        self._schedule_thumbs()
+        if not self._done and not self._pending and float(last) > 0.9:
+            self._pending = True
+            self.after_idle(self._load_page)
+
+    # --- thumbnail: chỉ giữ ảnh của các dòng đang nhìn thấy ---
+    def _visible(self) -> list[str]:
+        rows = self.tree.get_children()
+        if not rows or not self.tree.winfo_ismapped():   # chưa hiện: yview chưa đúng
+            return []
+        first, last = self.tree.yview()
+        i0, i1 = int(first * len(rows)), int(last * len(rows)) + 1
+        return list(rows[max(0, i0 - 2):i1 + 2])
+
+    def _schedule_thumbs(self):
+        if not self._thumbs_pending:
+            self._thumbs_pending = True
+            self.after_idle(self._refresh_thumbs)
+
+    def _refresh_thumbs(self):
+        self._thumbs_pending = False
+        if not self.winfo_exists():
+            return
+        vis = self._visible()
+        keep = set(vis)
+        for iid in [i for i in self._imgs if i not in keep]:    # trượt khỏi màn hình: nhả ảnh
+            if self._imgs[iid] is not None and self.tree.exists(iid):
+                self.tree.item(iid, image="", text="…")
+            del self._imgs[iid]
+        for iid in vis:
+            if iid in self._imgs or iid in self._requested:
+                continue
+            path = self.tree.item(iid, "values")[3]
+            if not path:
+                continue
+            tk_img = thumbs().peek(path, "s")
+            if tk_img is not None:
+                self._show_thumb(iid, tk_img)
+            else:
+                self._requested.add(iid)
+                self._loader.request(path, "s", iid)
+
+    def _show_thumb(self, iid, tk_img):
+        self._imgs[iid] = tk_img
+        self.tree.item(iid, image=tk_img or "", text="")
+
+    def _poll_thumbs(self):
+        vis = None
+        for iid, tk_img in self._loader.poll():
+            self._requested.discard(iid)
+            if not self.tree.exists(iid):
+                continue
+            vis = set(self._visible()) if vis is None else vis
+            if iid in vis:
+                self._show_thumb(iid, tk_img)
+        self._poll_id = self.after(self.POLL_MS, self._poll_thumbs)
+
     def _open_selected(self):
         item = self.tree.focus()
         if not item:
@@ -133,6 +250,19 @@ class Mainview:
         )
         self.btn_open.place(x=765, y=460, width=100, height=45)
 
+        self.btn_cancel = Button(
+            self.window, text="HỦY", font=("Times New Roman", 13),
+            bg="#FF9999", fg="white", command=self.cancel_jobs
+        )
+        self.btn_cancel.place(x=875, y=460, width=70, height=45)
+
+        # tiến trình nhận diện chạy nền
+        self.progress = ttk.Progressbar(self.frame_lap, mode="indeterminate", length=300)
+        self.progress.place(x=653, y=470)
+        self.label_status = Label(self.frame_lap, text="", font=("Times New Roman", 12),
+                                  fg="#000000", bg="#D3D3D3")
+        self.label_status.place(x=653, y=500)
+
         self.c = Canvas(self.frame_lap, width=70, height=80, bg="#D3D3D3", highlightthickness=0)
         self.c.place(x=565, y=190)
         self.c.create_line(10, 40, 60, 40, width=6, capstyle="round", arrow=LAST, arrowshape=(20, 22, 10))
@@ -168,7 +298,7 @@ class Mainview:
         # menu trái
         self.buttons = [
             Button(self.frame_menu, text="Trang chủ", font=("Times New Roman", 14),
-                   command=self.controller.home),
+                   command=self.go_home),
             Button(self.frame_menu, text="Tải ảnh lên", font=("Times New Roman", 14),
                    command=self.load_image),
             Button(self.frame_menu, text="Lịch sử", font=("Times New Roman", 14),
@@ -186,6 +316,12 @@ class Mainview:
         self.img_left_tk = None
         self.img_right_tk = None
         self.file_path = None
+        self.file_paths = []
+        self.image_frame = None     # ImageFrame của ảnh đang hiện, dùng chung với worker
+
+        # nhận diện chạy ở thread nền, kết quả lấy về bằng after()
+        self.worker = RecognitionWorker(self.controller)
+        self.window.after(100, self._poll_worker)
 
     # ===== functions =====
     def place_buttons(self):
@@ -194,49 +330,117 @@ class Mainview:
             btn.place(x=25, y=(i + 0.8) * gap, width=150, height=50)
 
     def load_image(self):
-        file_path = filedialog.askopenfilename(
+        file_paths = filedialog.askopenfilenames(
             filetypes=[("Image files", "*.jpg *.jpeg *.png *.bmp *.webp")]
         )
-        if not file_path:
+        if not file_paths:
             return
-        img = Image.open(file_path).resize((480, 350))
-        self.img_left_tk = ImageTk.PhotoImage(img)
-        self.file_path = file_path
+        self.file_paths = list(file_paths)
+        self.file_path = self.file_paths[0]
+        self.image_frame = ImageFrame.open(self.file_path)
+        if self.image_frame is None:
+            messagebox.showerror("Lỗi", "Không đọc được ảnh!")
+            self.file_paths = []
+            return
+        self._show_left(self.image_frame)
+        if len(self.file_paths) > 1:
+            self.label_status.config(text=f"Đã chọn {len(self.file_paths)} ảnh")
+
+    def _show_left(self, frame: ImageFrame):
+        # decode JPEG giảm cỡ gần 480x350 rồi mới resize, không decode ảnh gốc
+        rgb = cv2.cvtColor(frame.resized(480, 350), cv2.COLOR_BGR2RGB)
+        self._set_left(ImageTk.PhotoImage(Image.fromarray(rgb)))
+
+    def _set_left(self, img_tk):
+        self.img_left_tk = img_tk
         if self.img_label:
-            self.img_label.config(image=self.img_left_tk)
-            self.img_label.image = self.img_left_tk
+            self.img_label.config(image=img_tk)
+            self.img_label.image = img_tk
         else:
-            self.img_label = Label(self.frame_img, image=self.img_left_tk, bg="white")
+            self.img_label = Label(self.frame_img, image=img_tk, bg="white")
             self.img_label.pack(expand=True, fill="both")
 
     def detect_plate(self):
-        if not self.file_path:
+        if not self.file_paths:
             messagebox.showwarning("Cảnh báo", "Chưa chọn ảnh!")
             return
-        try:
-            img_crop_tk, text, img_vis_tk, conf = self.controller.detect_plate(self.file_path)
-        except Exception as e:
-            messagebox.showerror("Lỗi", str(e))
+        # đưa mọi ảnh đã chọn vào hàng đợi, UI không bị chặn
+        for fp in self.file_paths:
+            self.worker.submit(self.image_frame if fp == self.file_path and self.image_frame else fp)
+        self.file_paths = []
+        self._update_progress()
+
+    def cancel_jobs(self):
+        self.worker.cancel()
+        self._update_progress()
+
+    def go_home(self):
+        """Trang chủ: huỷ job, xoá ảnh + thông tin, không khởi động lại chương trình."""
+        self.worker.cancel()
+        self.controller.home()
+        self.file_path = None
+        self.file_paths = []
+        self.image_frame = None
+        if self.img_label:
+            self.img_label.destroy()
+            self.img_label = None
+        self.img_left_tk = self.img_right_tk = None
+        self.label_img2.config(image="")
+        self.label_img2.image = None
+        self.label_4.config(text="Mã biển số: ")
+        self.label_5.config(text="Tỉnh thành: ")
+        self.label_6a.config(text="Seri cấp phát: ")
+        self.label_6b.config(text="Mã cá nhân: ")
+        self.label_status.config(text="")
+        self._update_progress()
+
+    def _update_progress(self):
+        ready = getattr(self.controller, "ready", None)
+        if ready is not None and not ready.is_set():
+            self.progress.start(10)
+            self.label_status.config(text="Đang nạp mô hình...")
             return
+        n = self.worker.pending()
+        if n:
+            self.progress.start(10)
+            self.label_status.config(text=f"Đang nhận diện... còn {n} ảnh")
+        else:
+            self.progress.stop()
+            if self.label_status.cget("text") == "Đang nạp mô hình...":
+                err = getattr(self.controller, "load_error", None)
+                self.label_status.config(text=f"Nạp model lỗi: {err}" if err else "Sẵn sàng")
+
+    def _poll_worker(self):
+        for out in self.worker.poll():
+            self._show_result(out)
+        self._update_progress()
+        self.window.after(100, self._poll_worker)
+
+    def _show_result(self, out):
+        name = Path(out["file"]).name
+        if out["error"]:
+            self.label_status.config(text=f"Lỗi ({name}): {out['error']}")
+            return
+        plates = out["plates"]
+        if not plates:
+            self._show_left(out["img"])
+            self.label_status.config(text=f"Không phát hiện biển số: {name}")
+            return
+        img_crop_tk, img_vis_tk = self.controller.render(out["img"], plates)
+        text = plates[0]["text"]
+        more = f" ({len(plates)} biển: {', '.join(p['text'] for p in plates)})" if len(plates) > 1 else ""
+        self.label_status.config(text=f"Xong: {name}{more}")
 
         # hiển thị crop bên phải
-        if img_crop_tk:
-            self.label_img2.config(image=img_crop_tk)
-            self.label_img2.image = img_crop_tk
-            self.img_right_tk = img_crop_tk
+        self.label_img2.config(image=img_crop_tk)
+        self.label_img2.image = img_crop_tk
+        self.img_right_tk = img_crop_tk
 
         # bên trái: ảnh có bbox + text
-        if img_vis_tk:
-            if self.img_label:
-                self.img_label.config(image=img_vis_tk)
-                self.img_label.image = img_vis_tk
-            else:
-                self.img_label = Label(self.frame_img, image=img_vis_tk, bg="white")
-                self.img_label.pack(expand=True, fill="both")
+        self._set_left(img_vis_tk)
 
         if text:
             self.label_4.config(text=f"Mã biển số: {text}")
-            self.controller.history(text)
 
         # Tỉnh | Seri | Mã cá nhân
         fields = _extract_fields(text)
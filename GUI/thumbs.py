@@ -0,0 +1,129 @@
+from __future__ import annotations
+import queue
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from PIL import Image, ImageTk
+
+from Controller.store import THUMBS, pending_image, thumb_path
+
+# ==== LRU PhotoImage theo (ảnh, cỡ) ====
+class ThumbCache:
+    """
+    get(path, "s"|"m") -> PhotoImage đã thu nhỏ (hoặc None nếu không có ảnh).
+    Đọc thumbnail đã ghi sẵn lúc lưu (Controller/store.py); ảnh cũ chưa có thì
+    decode giảm cỡ (draft JPEG) + thumbnail() 1 lần rồi ghi lại để lần sau dùng.
+    Ảnh vừa lưu mà thread nền chưa ghi xong thì lấy thẳng bản trong RAM của ImageStore.
+    Widget đang hiển thị ảnh phải tự giữ reference: LRU có thể bỏ ảnh ra bất cứ lúc nào.
+    """
+    def __init__(self, max_items: int = 1024):
+        self.max_items = max_items
+        self._lru: OrderedDict[tuple, ImageTk.PhotoImage] = OrderedDict()
+
+    def get(self, path, size: str = "s"):
+        tk_img = self.peek(path, size)
+        if tk_img is not None:
+            return tk_img
+        img = self._load(Path(path), size)
+        return self.put(path, size, img) if img is not None else None
+
+    def peek(self, path, size: str = "s"):
+        """Chỉ tra LRU, không decode -> PhotoImage hoặc None."""
+        key = (str(path), size)
+        tk_img = self._lru.get(key)
+        if tk_img is not None:
+            self._lru.move_to_end(key)
+        return tk_img
+
+    def put(self, path, size: str, img):
+        """PIL Image (vd từ ThumbLoader) -> PhotoImage, nhớ vào LRU. Gọi trên thread Tk."""
+        key = (str(path), size)
+        tk_img = self._lru[key] = ImageTk.PhotoImage(img)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+        return tk_img
+
+    def _load(self, path: Path, size: str):
+        tp = thumb_path(path, size)
+        box = THUMBS[size]
+        pending = pending_image(path)
+        if pending is not None:                  # đang chờ ghi: thumbnail do thread nền tự ghi sau
+            img = Image.fromarray(pending[:, :, ::-1].copy() if pending.ndim == 3 else pending)
+            img.thumbnail(box, Image.LANCZOS)
+            return img
+        try:
+            if tp.exists():
+                return Image.open(tp)
+            if not path.exists():
+                return None                  # chưa ghi xong / đã bị xoá
+            img = Image.open(path)
+            if img.width <= box[0] and img.height <= box[1]:
+                return img
+            img.draft("RGB", box)            # JPEG: decode thẳng ở 1/2, 1/4, 1/8
+            img.thumbnail(box, Image.LANCZOS)
+            try:
+                tp.parent.mkdir(parents=True, exist_ok=True)
+                img.save(tp, quality=90)
+            except OSError:
+                pass
+            return img
+        except OSError:
+            return None
+
+# ==== Decode thumbnail ở thread nền ====
+class ThumbLoader:
+    """
+    Cho danh sách dài (HistoryWindow): request() rồi poll() định kỳ bằng after().
+    Thread nền chỉ decode ra PIL Image; PhotoImage dựng trong poll() trên thread Tk.
+    """
+    def __init__(self, cache: ThumbCache):
+        self.cache = cache
+        self.jobs: queue.Queue = queue.Queue()
+        self.results: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="thumb-loader", daemon=True)
+        self._thread.start()
+
+    def request(self, path, size: str, tag):
+        self.jobs.put((str(path), size, tag))
+
+    def cancel(self):
+        """Bỏ các yêu cầu chưa decode (vd khi lọc lại danh sách)."""
+        while True:
+            try:
+                self.jobs.get_nowait()
+            except queue.Empty:
+                return
+
+    def poll(self) -> list[tuple]:
+        """-> [(tag, PhotoImage | None)] của các ảnh đã decode xong."""
+        out = []
+        while True:
+            try:
+                path, size, tag, img = self.results.get_nowait()
+            except queue.Empty:
+                return out
+            out.append((tag, self.cache.put(path, size, img) if img is not None else None))
+
+    def stop(self):
+        self.cancel()
+        self.jobs.put(None)
+
+    def _run(self):
+        while (job := self.jobs.get()) is not None:
+            path, size, tag = job
+            try:
+                img = self.cache._load(Path(path), size)
+                if img is not None:
+                    img.load()                    # decode hết ở đây, không để lại cho thread Tk
+            except Exception:
+                img = None
+            self.results.put((path, size, tag, img))
+
+_CACHE: ThumbCache | None = None
+
+def thumbs() -> ThumbCache:
+    """Cache dùng chung cho mọi cửa sổ (cần Tk root đã tạo)."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = ThumbCache()
+    return _CACHE
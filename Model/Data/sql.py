@@ -1,21 +1,78 @@
 from __future__ import annotations
+import atexit
+import json
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import re
 from datetime import datetime
+import metrics
 
 # === Đường dẫn CSDL ===
 DB_PATH = Path(__file__).resolve().parent / "bien_so.db"
 
+# === Kết nối dùng chung ===
+# 1 connection cho cả tiến trình (mở lại nếu bị fork), mọi thread dùng chung qua _LOCK.
+_LOCK = threading.RLock()
+_CONN: sqlite3.Connection | None = None
+_PID = None
+_SCHEMA_OK = False
+_TINH: dict[str, str] | None = None   # cache MaTinh -> TenTinh
+_HOOKS_LUU: list = []                  # gọi fn(bien_so) sau mỗi luu_lich_su
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
 # === Helpers ===
 def _conn():
-    conn = sqlite3.connect(DB_PATH.as_posix())
-    conn.row_factory = sqlite3.Row
-    return conn
+    global _CONN, _PID
+    with _LOCK:
+        if _CONN is None or _PID != os.getpid():
+            c = sqlite3.connect(DB_PATH.as_posix(), check_same_thread=False)
+            c.row_factory = sqlite3.Row
+            for p in _PRAGMAS:
+                c.execute(p)
+            _CONN, _PID = c, os.getpid()
+        return _CONN
+
+@contextmanager
+def _tx():
+    """Giữ khoá + transaction (commit khi xong, rollback khi lỗi)."""
+    with _LOCK:
+        c = _conn()
+        with c:
+            yield c
+
+def dong_ket_noi():
+    global _CONN
+    with _LOCK:
+        if _CONN is not None and _PID == os.getpid():
+            _CONN.close()
+        _CONN = None
+atexit.register(dong_ket_noi)
+
+def dung_db(path: str | Path):
+    """Chuyển sang file CSDL khác (vd DB tạm cho benchmark/test); schema + seed tạo lại."""
+    global DB_PATH, _SCHEMA_OK, _TINH
+    with _LOCK:
+        dong_ket_noi()
+        DB_PATH = Path(path)
+        _SCHEMA_OK, _TINH = False, None
+    _maybe_seed_tinh()
 
 def _ensure_schema():
-    """Tạo bảng nếu chưa có + đảm bảo có cột image_path trong lịch sử."""
-    with _conn() as c:
+    """Tạo bảng nếu chưa có + đảm bảo có cột image_path trong lịch sử (chạy 1 lần)."""
+    global _SCHEMA_OK
+    if _SCHEMA_OK:
+        return
+    with _tx() as c:
         # bảng mã tỉnh -> tên tỉnh
         c.execute("""
             CREATE TABLE IF NOT EXISTS tinh(
@@ -37,58 +94,212 @@ def _ensure_schema():
         cols = [r["name"] for r in c.execute("PRAGMA table_info(lichsu)").fetchall()]
         if "ImagePath" not in cols:
             c.execute("ALTER TABLE lichsu ADD COLUMN ImagePath TEXT")
-        c.commit()
+        # BienSoChuan: biển chỉ còn chữ + số ("29-A1 234.56" -> "29A123456") để lọc theo tiền tố
+        if "BienSoChuan" not in cols:
+            c.execute("ALTER TABLE lichsu ADD COLUMN BienSoChuan TEXT")
+        # index cho lọc theo biển / thời gian
+        c.execute("CREATE INDEX IF NOT EXISTS idx_lichsu_bienso  ON lichsu(BienSo)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_lichsu_bienso_chuan ON lichsu(BienSoChuan)")
+        rows = c.execute("SELECT ID, BienSo FROM lichsu WHERE BienSoChuan IS NULL").fetchall()
+        c.executemany("UPDATE lichsu SET BienSoChuan=? WHERE ID=?",
+                      [(_bien_chuan(r["BienSo"]), r["ID"]) for r in rows])
+        c.execute("CREATE INDEX IF NOT EXISTS idx_lichsu_ngaygio ON lichsu(NgayGio)")
+        # cache kết quả nhận diện theo hash nội dung ảnh (Model = dấu vân tay weights,
+        # KetQua = JSON list các biển trong ảnh; bảng kiểu cũ 1 biển/ảnh thì tạo lại vì chỉ là cache)
+        cols = [r["name"] for r in c.execute("PRAGMA table_info(cache_nhan_dien)").fetchall()]
+        if cols and "KetQua" not in cols:
+            c.execute("DROP TABLE cache_nhan_dien")
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS cache_nhan_dien(
+                Khoa    TEXT PRIMARY KEY,
+                Model   TEXT NOT NULL,
+                KetQua  TEXT NOT NULL,
+                NgayGio TEXT NOT NULL DEFAULT (datetime('now','localtime'))
+            )
+        """)
+        # ledger của ingest.py: file trong thư mục theo dõi đã xử lý chưa (restart không làm lại).
+        # File bị ghi đè (khác Size / MTimeNs) thì coi là file mới.
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_ledger(
+                Path      TEXT PRIMARY KEY,
+                Size      INTEGER NOT NULL,
+                MTimeNs   INTEGER NOT NULL,
+                TrangThai TEXT NOT NULL,
+                SoBien    INTEGER NOT NULL DEFAULT 0,
+                Loi       TEXT,
+                NgayGio   TEXT NOT NULL DEFAULT (datetime('now','localtime'))
+            )
+        """)
+    _SCHEMA_OK = True
 
 # === API tỉnh/thành ===
+def _tinh_map() -> dict[str, str]:
+    global _TINH
+    if _TINH is None:
+        _ensure_schema()
+        with _tx() as c:
+            _TINH = {r["MaTinh"]: r["TenTinh"]
+                     for r in c.execute("SELECT MaTinh, TenTinh FROM tinh")}
+    return _TINH
+
+def ds_tinh() -> list[str]:
+    """Danh sách tên tỉnh (không trùng, đã sort)."""
+    return sorted(set(_tinh_map().values()))
+
+def nap_lai_tinh():
+    """Bỏ cache tỉnh (gọi sau khi sửa bảng tinh từ ngoài)."""
+    global _TINH
+    _TINH = None
+
 def lay_tinh(ma_or_plate: str) -> str:
     """
     Nhận vào 2 số mã tỉnh hoặc cả chuỗi biển -> trả về tên tỉnh.
-    Tự mở/đóng DB mỗi lần gọi (không dùng connection toàn cục).
+    Tra trong cache bộ nhớ, không đụng tới đĩa.
     """
     s = str(ma_or_plate).strip().upper()
     m = re.match(r"^([1-9]\d)", s)
     ma_tinh = m.group(1) if m else s[:2]
 
-    _ensure_schema()
     try:
-        with _conn() as c:
-            row = c.execute(
-                "SELECT TenTinh FROM tinh WHERE MaTinh=?",
-                (ma_tinh,)
-            ).fetchone()
-            return row["TenTinh"] if row else "Không xác định"
+        return _tinh_map().get(ma_tinh, "Không xác định")
     except Exception as e:
         print("DB error lay_tinh:", e)
         return "Không xác định"
 
 # === API lịch sử ===
+def _bien_chuan(bien_so: str) -> str:
+    return re.sub(r"[^A-Z0-9]", "", str(bien_so).upper())
+
 def luu_lich_su(bien_so: str, image_path: str | None = None) -> int:
     """Lưu 1 bản ghi lịch sử, trả về id bản ghi.
        Truyền NgayGio = datetime('now','localtime') để tránh lỗi NOT NULL."""
     _ensure_schema()
     ten_tinh = lay_tinh(bien_so)
-    with _conn() as c:
+    with metrics.span(stage="sql_write"), _tx() as c:
         cur = c.execute(
             """
-            INSERT INTO lichsu (BienSo, TenTinh, NgayGio, ImagePath)
-            VALUES (?, ?, datetime('now','localtime'), ?)
+            INSERT INTO lichsu (BienSo, BienSoChuan, TenTinh, NgayGio, ImagePath)
+            VALUES (?, ?, ?, datetime('now','localtime'), ?)
             """,
-            (bien_so, ten_tinh, image_path)
+            (bien_so, _bien_chuan(bien_so), ten_tinh, image_path)
         )
-        c.commit()
-        return int(cur.lastrowid)
+    metrics.inc("btl_sql_writes_total")
+    for fn in _HOOKS_LUU:
+        try:
+            fn(bien_so)
+        except Exception as e:
+            print("Hook luu_lich_su error:", e)
+    return int(cur.lastrowid)
+
+def them_hook_luu(fn):
+    """Đăng ký fn(bien_so) chạy sau mỗi lần lưu lịch sử (vd cập nhật PlateIndex)."""
+    with _LOCK:
+        if fn not in _HOOKS_LUU:
+            _HOOKS_LUU.append(fn)
+
+def ds_bien_so() -> list[str]:
+    """Mọi biển số khác nhau đã lưu trong lichsu."""
+    _ensure_schema()
+    with _LOCK:
+        return [r[0] for r in _conn().execute(
+            "SELECT DISTINCT BienSo FROM lichsu WHERE BienSo IS NOT NULL").fetchall()]
 
 def get_lich_su(limit: int = 200) -> list[dict]:
     """Lấy danh sách lịch sử (mới nhất trước)."""
+    return tim_lich_su(limit=limit)
+
+def tim_lich_su(limit: int = 200, truoc_id: int | None = None, bien_so: str | None = None,
+                tinh: str | None = None, tu: str | None = None, den: str | None = None) -> list[dict]:
+    """
+    Phân trang kiểu keyset (mới nhất trước): trang sau truyền truoc_id = ID nhỏ nhất của trang trước.
+    bien_so: tiền tố biển, bỏ qua dấu/khoảng trắng ("29A", "29-a1 2" đều khớp "29-A1 234.56"),
+    tinh: tên tỉnh,
+    tu/den: khoảng NgayGio 'YYYY-MM-DD[ HH:MM:SS]' (den tính hết ngày nếu chỉ có ngày).
+    """
     _ensure_schema()
-    with _conn() as c:
+    where, args = [], []
+    if truoc_id is not None:
+        where.append("ID < ?"); args.append(int(truoc_id))
+    p = _bien_chuan(bien_so or "")
+    if p:
+        where.append("BienSoChuan >= ? AND BienSoChuan < ?"); args += [p, p + "\uffff"]
+    if tinh:
+        where.append("TenTinh = ?"); args.append(tinh)
+    if tu:
+        where.append("NgayGio >= ?"); args.append(tu.strip())
+    if den:
+        den = den.strip()
+        where.append("NgayGio <= ?"); args.append(den + " 23:59:59" if len(den) == 10 else den)
+    sql_where = (" WHERE " + " AND ".join(where)) if where else ""
+    with _tx() as c:
         rows = c.execute(
             "SELECT ID, BienSo, TenTinh, NgayGio, ImagePath "
-            "FROM lichsu ORDER BY ID DESC LIMIT ?",
-            (limit,)
+            f"FROM lichsu{sql_where} ORDER BY ID DESC LIMIT ?",
+            (*args, limit)
         ).fetchall()
         return [dict(r) for r in rows]
 
+# === API cache nhận diện ===
+def cache_lay(khoa: str, model: str) -> list[dict] | None:
+    """Tra cache theo hash ảnh -> list biển ([] = ảnh không có biển), None nếu chưa có."""
+    _ensure_schema()
+    with _tx() as c:
+        r = c.execute(
+            "SELECT KetQua FROM cache_nhan_dien WHERE Khoa=? AND Model=?",
+            (khoa, model)
+        ).fetchone()
+        return json.loads(r["KetQua"]) if r else None
+
+def cache_luu(khoa: str, model: str, ket_qua: list[dict]):
+    _ensure_schema()
+    with _tx() as c:
+        c.execute(
+            "INSERT OR REPLACE INTO cache_nhan_dien(Khoa, Model, KetQua) VALUES (?,?,?)",
+            (khoa, model, json.dumps(ket_qua, ensure_ascii=False))
+        )
+
+def cache_cat(max_rows: int) -> int:
+    """Giữ max_rows dòng ghi gần nhất (INSERT OR REPLACE cấp rowid mới), trả số dòng đã xoá."""
+    _ensure_schema()
+    with _tx() as c:
+        return c.execute(
+            "DELETE FROM cache_nhan_dien WHERE rowid < "
+            "(SELECT rowid FROM cache_nhan_dien ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+            (max(0, int(max_rows) - 1),)
+        ).rowcount
+
+def cache_don(model: str) -> int:
+    """Xoá cache của weights cũ (khác model hiện tại), trả số dòng đã xoá."""
+    _ensure_schema()
+    with _tx() as c:
+        return c.execute("DELETE FROM cache_nhan_dien WHERE Model<>?", (model,)).rowcount
+
+# === API ledger ingest ===
+def ledger_thu_muc(root: str) -> dict[str, tuple[int, int]]:
+    """Path -> (Size, MTimeNs) của mọi file đã ghi ledger nằm dưới thư mục root."""
+    _ensure_schema()
+    p = os.path.join(root, "")
+    with _LOCK:
+        rows = _conn().execute(
+            "SELECT Path, Size, MTimeNs FROM ingest_ledger WHERE Path >= ? AND Path < ?",
+            (p, p + "\uffff")
+        ).fetchall()
+    return {r["Path"]: (r["Size"], r["MTimeNs"]) for r in rows}
+
+def ledger_ghi(rows: list[tuple]):
+    """Ghi nhiều dòng (path, size, mtime_ns, trang_thai 'ok'|'loi', so_bien, loi) trong 1 transaction."""
+    if not rows:
+        return
+    _ensure_schema()
+    with metrics.span(stage="sql_write"), _tx() as c:
+        c.executemany(
+            """
+            INSERT OR REPLACE INTO ingest_ledger(Path, Size, MTimeNs, TrangThai, SoBien, Loi, NgayGio)
+            VALUES (?, ?, ?, ?, ?, ?, datetime('now','localtime'))
+            """,
+            rows
+        )
+
 # ====== (tuỳ chọn) seed nhanh một số mã tỉnh nếu DB trống ======
 _SEED = [
     ('29','Hà Nội'), ('30','Hà Nội'), ('31','Hà Nội'), ('32','Hà Nội'), ('33','Hà Nội'),
@@ -98,9 +309,9 @@ _SEED = [
 ]
 def _maybe_seed_tinh():
     _ensure_schema()
-    with _conn() as c:
+    with _tx() as c:
         cur = c.execute("SELECT COUNT(1) AS n FROM tinh").fetchone()
         if (cur["n"] or 0) < 10:
             c.executemany("INSERT OR IGNORE INTO tinh(MaTinh, TenTinh) VALUES(?,?)", _SEED)
-            c.commit()
+            nap_lai_tinh()
 _maybe_seed_tinh()
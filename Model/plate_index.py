@@ -0,0 +1,119 @@
+from __future__ import annotations
+import re
+import threading
+
+# biển đã chuẩn hoá: 2 số tỉnh + 1-2 chữ + 1 số + 4-5 số (8-10 ký tự)
+PLATE_CANON = re.compile(r'^([1-9]\d)([A-Z]{1,2})(\d)(\d{4,5})$')
+MIN_QUERY = 7     # ngắn hơn thì 3 khoá bên dưới không còn đủ (và dễ khớp nhầm)
+
+def canon(text: str) -> str:
+    return "".join(ch for ch in text.upper() if ch.isalnum())
+
+def within1(a: str, b: str) -> bool:
+    """Khoảng cách Levenshtein(a, b) <= 1."""
+    la, lb = len(a), len(b)
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    if lb - la > 1:
+        return False
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i+1:] == b[i+1:]      # thay 1 ký tự (hoặc trùng hẳn)
+    return a[i:] == b[i+1:]            # b thừa 1 ký tự
+
+class PlateIndex:
+    """
+    Tập biển đã gặp, tra biển cách chuỗi OCR <= 1 ký tự (thêm / bớt / thay).
+    Thay vì BK-tree (tra phải duyệt nhiều nhánh) dùng 3 bảng băm theo nguyên lý chuồng bồ câu:
+    với 1 lỗi ở vị trí i (chuỗi dài >= 7, biển >= 8), hai chuỗi chắc chắn trùng
+      i >= 6     -> 6 ký tự đầu
+      4 <= i < 6 -> 4 ký tự đầu + 2 ký tự cuối
+      i < 4      -> 4 ký tự cuối
+    nên chỉ cần so within1 với các biển cùng khoá (vài chục biển kể cả khi có hàng trăm nghìn).
+    add() an toàn khi gọi từ thread khác trong lúc lookup().
+    """
+    def __init__(self, plates=()):
+        self._known: set[str] = set()
+        self._keys: tuple[dict, dict, dict] = ({}, {}, {})
+        self._lock = threading.Lock()
+        for p in plates:
+            self.add(p)
+
+    @staticmethod
+    def _bucket_keys(s: str):
+        return s[:6], s[:4] + "|" + s[-2:], s[-4:]
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, text):
+        return canon(text) in self._known
+
+    def add(self, plate: str) -> bool:
+        """Thêm biển (bỏ qua chuỗi không đúng dạng biển). True nếu là biển mới."""
+        s = canon(plate)
+        if not PLATE_CANON.match(s):
+            return False
+        with self._lock:
+            if s in self._known:
+                return False
+            self._known.add(s)
+            for table, k in zip(self._keys, self._bucket_keys(s)):
+                bucket = table.get(k)
+                if bucket is None:
+                    table[k] = [s]
+                else:
+                    bucket.append(s)     # list: lookup đang duyệt vẫn an toàn
+        return True
+
+    def lookup(self, text: str) -> str | None:
+        """Biển đã biết (dạng chuẩn hoá) cách text <= 1 ký tự; None nếu không có hoặc có
+        từ 2 biển cùng cách 1 ký tự (mơ hồ -> để OCR đầy đủ quyết định)."""
+        s = canon(text)
+        if s in self._known:
+            return s
+        if len(s) < MIN_QUERY:
+            return None
+        hit = None
+        for table, k in zip(self._keys, self._bucket_keys(s)):
+            for p in table.get(k, ()):
+                if p != hit and within1(s, p):
+                    if hit is not None:
+                        return None
+                    hit = p
+        return hit
+
+    def snap(self, text: str) -> str | None:
+        """lookup() để sửa kết quả OCR: chỉ khi text chưa phải biển hợp lệ. Text đã đúng dạng biển
+        mà không có trong tập (vd "30B12345" cạnh biển đã biết "30B123456") là xe khác, giữ nguyên."""
+        s = canon(text)
+        if s in self._known:
+            return s
+        if PLATE_CANON.match(s):
+            return None
+        return self.lookup(s)
+
+    @classmethod
+    def from_db(cls, watch: bool = True) -> "PlateIndex":
+        """Nạp mọi biển khác nhau trong lichsu; watch=True -> tự thêm biển mới mỗi lần luu_lich_su."""
+        from Model.Data import sql
+        idx = cls(sql.ds_bien_so())
+        if watch:
+            sql.them_hook_luu(idx.add)
+        return idx
+
+if __name__ == "__main__":
+    # tự kiểm tra: python -m Model.plate_index
+    idx = PlateIndex(["30B123456", "29A112345", "29A112346", "51F12345"])
+    assert idx.lookup("30-B1 234.56") == "30B123456"            # trùng hẳn (bỏ dấu)
+    assert idx.snap("30B1Z3456") == "30B123456"                  # thay 1 ký tự, chuỗi sai dạng
+    assert idx.snap("30B12345G6") == "30B123456"                 # thừa 1 ký tự
+    assert idx.lookup("30B12345") == "30B123456"                 # thiếu 1 ký tự: cách 1 ...
+    assert idx.snap("30B12345") is None                          # ... nhưng là biển hợp lệ -> xe khác
+    assert idx.snap("51F12346") is None                          # biển hợp lệ khác 1 số
+    assert idx.snap("29A11234X") is None                         # cách đều 2 biển -> mơ hồ
+    assert idx.lookup("29A1123") is None                         # ngắn hơn MIN_QUERY
+    assert not idx.add("ABC") and len(idx) == 4                  # không đúng dạng biển -> bỏ
+    print("plate_index: OK")
@@ -0,0 +1,133 @@
+# batch.py  (nhận diện hàng loạt, không GUI)
+from __future__ import annotations
+import argparse, csv, glob, json, sys, time
+from pathlib import Path
+import cv2
+
+from Controller.ctl import A_ctl, save_history
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+FIELDS = ["file", "plate_idx", "text", "raw", "conf", "bbox", "decode_ms", "det_ms", "ocr_ms", "id", "error"]
+
+# --------- input ----------
+def iter_images(src: str):
+    """Thư mục (quét đệ quy) hoặc glob pattern -> các đường dẫn ảnh, đã sort."""
+    p = Path(src)
+    if p.is_dir():
+        files = (f for f in p.rglob("*") if f.suffix.lower() in IMG_EXTS)
+    else:
+        files = (Path(f) for f in glob.glob(src, recursive=True))
+    yield from sorted(f for f in files if f.suffix.lower() in IMG_EXTS)
+
+def chunks(it, n: int):
+    buf = []
+    for x in it:
+        buf.append(x)
+        if len(buf) >= n:
+            yield buf; buf = []
+    if buf:
+        yield buf
+
+# --------- output ----------
+class ResultWriter:
+    """Ghi kết quả dạng stream: .csv -> CSV, còn lại (kể cả '-') -> JSONL."""
+    def __init__(self, out: str):
+        self.f = sys.stdout if out == "-" else open(out, "w", encoding="utf-8", newline="")
+        self.csv = None
+        if out.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.f, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row: dict):
+        if self.csv:
+            r = dict(row)
+            if r.get("bbox"): r["bbox"] = " ".join(map(str, r["bbox"]))
+            self.csv.writerow(r)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+# --------- run ----------
+def run(ctl: A_ctl, files, writer: ResultWriter, batch_size=16, save_db=False) -> dict:
+    n_img = n_plate = n_err = 0
+    t_all = time.perf_counter()
+    for paths in chunks(files, batch_size):
+        imgs, rows = [], []
+        for fp in paths:
+            t0 = time.perf_counter()
+            img = cv2.imread(str(fp))
+            row = {"file": str(fp), "decode_ms": round((time.perf_counter()-t0)*1000, 2)}
+            if img is None:
+                row["error"] = "decode"; n_err += 1
+                writer.write(row)
+                continue
+            imgs.append(img); rows.append(row)
+
+        # mỗi biển 1 dòng; ảnh không có biển -> 1 dòng lỗi no_plate
+        for row, plates in zip(rows, ctl.recognize_all_batch(imgs)):
+            n_img += 1
+            if not plates:
+                row["error"] = "no_plate"
+                writer.write(row)
+                continue
+            for k, r in enumerate(plates):
+                n_plate += 1
+                rec = dict(row, plate_idx=k, text=r["text"], raw=r["raw"], conf=round(r["conf"], 4),
+                           bbox=list(r["bbox"]), det_ms=round(r["det_ms"], 2),
+                           ocr_ms=round(r["ocr_ms"], 2))
+                if save_db and r["text"]:
+                    rec["id"] = ctl.history(r["text"], r["crop"])
+                writer.write(rec)
+    dt = time.perf_counter() - t_all
+    return {"images": n_img, "plates": n_plate, "errors": n_err,
+            "seconds": round(dt, 2), "img_per_s": round(n_img / dt, 2) if dt else 0.0}
+
+def run_procs(files, writer: ResultWriter, n_ocr=None, model=None, save_db=False) -> dict:
+    """Chế độ nhiều tiến trình (Controller/pipeline.py): decode | detect | n_ocr x OCR."""
+    from Controller.pipeline import Pipeline
+    n_plate = n_err = 0
+    seen = set()
+    t_all = time.perf_counter()
+    for r in Pipeline(model_path=model, n_ocr=n_ocr, with_crop=save_db).run(files):
+        seen.add(r["file"])
+        crop = r.pop("crop", None)
+        if "error" in r:
+            n_err += r["error"] == "decode"
+        else:
+            n_plate += 1
+            r["conf"] = round(r["conf"], 4)
+            r["det_ms"], r["ocr_ms"] = round(r["det_ms"], 2), round(r["ocr_ms"], 2)
+            if save_db and r["text"]:
+                r["id"] = save_history(r["text"], crop)
+        writer.write(r)
+    dt = time.perf_counter() - t_all
+    n_img = len(seen) - n_err
+    return {"images": n_img, "plates": n_plate, "errors": n_err,
+            "seconds": round(dt, 2), "img_per_s": round(n_img / dt, 2) if dt else 0.0}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Nhận diện biển số hàng loạt (không GUI)")
+    ap.add_argument("input", help="thư mục ảnh hoặc glob, vd 'snap/**/*.jpg'")
+    ap.add_argument("-o", "--out", default="-", help="file .csv hoặc .jsonl ('-' = stdout)")
+    ap.add_argument("-b", "--batch-size", type=int, default=16)
+    ap.add_argument("--model", default=None, help="đường dẫn best.pt (mặc định: bản mới nhất trong runs/)")
+    ap.add_argument("--save-db", action="store_true", help="ghi thêm vào bảng lichsu")
+    ap.add_argument("--procs", type=int, default=0,
+                    help="số tiến trình OCR (>0: chạy pipeline đa tiến trình, -1: theo số lõi)")
+    args = ap.parse_args()
+
+    writer = ResultWriter(args.out)
+    try:
+        if args.procs:
+            stats = run_procs(iter_images(args.input), writer, args.procs if args.procs > 0 else None,
+                              args.model, args.save_db)
+        else:
+            ctl = A_ctl(model_path=args.model)
+            stats = run(ctl, iter_images(args.input), writer, args.batch_size, args.save_db)
+    finally:
+        writer.close()
+    print(json.dumps(stats), file=sys.stderr)
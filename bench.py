@@ -0,0 +1,196 @@
+# bench.py  (đo từng công đoạn của pipeline nhận diện)
+from __future__ import annotations
+import argparse, json, platform, random, subprocess, sys, tempfile, time
+from datetime import datetime
+from pathlib import Path
+import cv2, numpy as np
+
+from detect_ocr import (ANGLES, check_prep_engine, crop_expand, deskew_by_min_area_rect, engine,
+                        prep_variants, rotate, _readtext)
+from Controller.ctl import A_ctl, DET_CONF, HISTORY_DIR, _format_from_raw
+from Model.Data import sql
+
+try:
+    import resource
+except ImportError:          # Windows
+    resource = None
+
+BASE = Path(__file__).resolve().parent
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# --------- đo ----------
+def peak_rss_mb() -> float | None:
+    """Đỉnh RSS của cả tiến trình tới thời điểm gọi (chỉ tăng, không phải RAM riêng của 1 stage)."""
+    if resource is not None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / 1024 / (1024 if sys.platform == "darwin" else 1), 1)  # macOS trả byte
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+    except Exception:
+        return None
+
+class Bench:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.rss: dict[str, float | None] = {}
+
+    def time(self, stage: str, fn, *args):
+        t0 = time.perf_counter_ns()
+        out = fn(*args)
+        self.samples.setdefault(stage, []).append((time.perf_counter_ns() - t0) / 1e6)
+        return out
+
+    def mark(self, stage: str):
+        self.rss[stage] = peak_rss_mb()
+
+    def report(self) -> dict:
+        out = {}
+        for stage, xs in self.samples.items():
+            a = np.asarray(xs)
+            out[stage] = {
+                "n": len(xs),
+                "p50_ms": round(float(np.percentile(a, 50)), 3),
+                "p95_ms": round(float(np.percentile(a, 95)), 3),
+                "p99_ms": round(float(np.percentile(a, 99)), 3),
+                "mean_ms": round(float(a.mean()), 3),
+                "per_s": round(1000.0 / a.mean(), 2) if a.mean() > 0 else None,
+                "process_peak_rss_mb": self.rss.get(stage),   # đỉnh RSS tiến trình sau stage
+            }
+        return out
+
+# --------- corpus ----------
+def _rand_plate(rng: random.Random) -> str:
+    L = "ABCDEFGHKLMNPSTUVXYZ"
+    prov = rng.randint(11, 99)
+    return f"{prov}{rng.choice(L)}{rng.randint(1, 9)}-{rng.randint(100, 999)}.{rng.randint(0, 99):02d}"
+
+def synth_plates(n: int, out_dir: Path, seed: int = 0) -> list[Path]:
+    """Sinh ảnh biển số giả: nền trắng, viền đen, text, xoay nhẹ + nhiễu."""
+    rng = random.Random(seed); nrng = np.random.default_rng(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(n):
+        img = np.full((140, 560, 3), 235, np.uint8)
+        cv2.rectangle(img, (8, 8), (551, 131), (20, 20, 20), 4)
+        cv2.putText(img, _rand_plate(rng), (24, 98), cv2.FONT_HERSHEY_DUPLEX, 2.2,
+                    (15, 15, 15), 5, cv2.LINE_AA)
+        img = rotate(img, rng.uniform(-5, 5))
+        img = np.clip(img.astype(np.int16) + nrng.normal(0, 8, img.shape), 0, 255).astype(np.uint8)
+        p = out_dir / f"synth_{i:04d}.jpg"
+        cv2.imwrite(str(p), img)
+        paths.append(p)
+    return paths
+
+def corpus(n_synth: int, tmp: Path, limit: int | None) -> list[Path]:
+    files = sorted(p for p in HISTORY_DIR.rglob("*") if p.suffix.lower() in IMG_EXTS)
+    files += synth_plates(n_synth, tmp / "synth")
+    return files[:limit] if limit else files
+
+# --------- chạy ----------
+def run(files, with_models=True, ocr_passes=True) -> tuple[dict, dict]:
+    """-> (thống kê từng stage, kết quả kiểm tra)."""
+    b = Bench()
+    imgs = [b.time("decode", cv2.imread, str(p)) for p in files]
+    imgs = [im for im in imgs if im is not None]
+    b.mark("decode")
+
+    # không cache / không nạp biển đã biết: A_ctl không đụng tới bien_so.db thật
+    ctl = A_ctl(background=False, cache=False, known_plates=False) if with_models else None
+    bboxes = []
+    for im in imgs:
+        bbox = None
+        if ctl is not None:
+            det = b.time("yolo_predict", lambda x: ctl.detector.predict(
+                source=x, conf=DET_CONF, device=ctl.device, verbose=False)[0], im)
+            if len(det.boxes):
+                bbox = det.boxes.xyxy[int(det.boxes.conf.argmax())].tolist()
+        bboxes.append(bbox or [0, 0, im.shape[1], im.shape[0]])  # crop có sẵn -> cả ảnh
+    if ctl is not None:
+        b.mark("yolo_predict")
+
+    crops = [b.time("crop_expand", crop_expand, im, bb) for im, bb in zip(imgs, bboxes)]
+    b.mark("crop_expand")
+    crops = [b.time("deskew", deskew_by_min_area_rect, c) for c in crops]
+    b.mark("deskew")
+    preps = [b.time("prep_variants", prep_variants, c) for c in crops]
+    b.mark("prep_variants")
+    eng = engine()
+    for c in crops:
+        b.time("prep_engine", eng.variants, c)   # cùng kết quả, dùng lại buffer
+    b.mark("prep_engine")
+    bad = check_prep_engine(crops)
+    if bad:
+        print(f"CẢNH BÁO: PrepEngine.variants khác prep_variants ở {len(bad)}/{len(crops)} crop",
+              file=sys.stderr)
+    checks = {"prep_engine_mismatch": len(bad)}
+
+    raws = []
+    if ctl is not None and ocr_passes:
+        for variants in preps:
+            for vi, v in enumerate(variants):
+                for ang in ANGLES:
+                    res = b.time(f"ocr_pass[v{vi},a{ang}]", _readtext, ctl.reader, rotate(v, ang))
+                    raws.append(" ".join(t[1] for t in res) if res else "")
+        b.mark("ocr_pass")
+        for k in [k for k in b.samples if k.startswith("ocr_pass[")]:
+            b.samples.setdefault("ocr_pass", []).extend(b.samples[k])
+    raws = raws or [p.stem.split("_")[-1] for p in files]  # không OCR -> dùng tên file làm raw
+    for r in raws:
+        b.time("format_from_raw", _format_from_raw, r)
+    b.mark("format_from_raw")
+
+    prev_db = sql.DB_PATH
+    with tempfile.TemporaryDirectory() as td:
+        sql.dung_db(Path(td) / "bench.db")
+        try:
+            for r in raws:
+                b.time("sql_luu_lich_su", sql.luu_lich_su, _format_from_raw(r) or "?", None)
+            b.mark("sql_luu_lich_su")
+        finally:
+            sql.dung_db(prev_db)           # đóng DB tạm trước khi xoá thư mục, trả lại DB cũ
+    return b.report(), checks
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def compare(cur: dict, base: dict):
+    print(f"{'stage':28} {'p50 base':>10} {'p50 now':>10} {'Δ%':>7}   {'p95 base':>10} {'p95 now':>10} {'Δ%':>7}")
+    for k, v in cur["stages"].items():
+        o = base["stages"].get(k)
+        if not o:
+            continue
+        d = lambda a, b: f"{(b - a) / a * 100:+.1f}" if a else "n/a"
+        print(f"{k:28} {o['p50_ms']:10.3f} {v['p50_ms']:10.3f} {d(o['p50_ms'], v['p50_ms']):>7}   "
+              f"{o['p95_ms']:10.3f} {v['p95_ms']:10.3f} {d(o['p95_ms'], v['p95_ms']):>7}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark từng công đoạn nhận diện biển số")
+    ap.add_argument("-o", "--out", default="bench_output.json", help="file JSON kết quả")
+    ap.add_argument("--synthetic", type=int, default=50, help="số ảnh biển số giả")
+    ap.add_argument("--limit", type=int, default=None, help="giới hạn số ảnh")
+    ap.add_argument("--no-models", action="store_true", help="bỏ YOLO + EasyOCR")
+    ap.add_argument("--no-ocr", action="store_true", help="bỏ các lượt EasyOCR")
+    ap.add_argument("--compare", default=None, help="JSON của lần chạy trước để so sánh")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as td:
+        files = corpus(args.synthetic, Path(td), args.limit)
+        stages, checks = run(files, with_models=not args.no_models, ocr_passes=not args.no_ocr)
+    result = {
+        "meta": {"commit": _git_rev(), "time": datetime.now().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "platform": platform.platform(),
+                 "images": len(files)},
+        "stages": stages,
+        "checks": checks,
+    }
+    Path(args.out).write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    for k, v in stages.items():
+        print(f"{k:28} n={v['n']:<5} p50={v['p50_ms']:9.3f}ms p95={v['p95_ms']:9.3f}ms "
+              f"p99={v['p99_ms']:9.3f}ms {v['per_s'] or 0:9.1f}/s peak_rss={v['process_peak_rss_mb']}MB")
+    if args.compare:
+        compare(result, json.loads(Path(args.compare).read_text()))
@@ -1,14 +1,32 @@
 # detect_ocr.py  (EasyOCR only)
 from __future__ import annotations
-from ultralytics import YOLO
-import cv2, numpy as np, re
+import cv2, numpy as np, re, json, threading
+from collections import OrderedDict
 from pathlib import Path
-import easyocr
+from typing import TYPE_CHECKING
+import metrics
+if TYPE_CHECKING:  # import nặng, chỉ nạp khi chạy thật (xem MAIN)
+    import easyocr
+    from Model.plate_index import PlateIndex
 
 # ===== Config =====
 CLASS_NAME = "bien so"
 VN_PLATE_REGEX = re.compile(r'([1-9]\d)[A-Z]{1,2}\d{4,5}')
 BASE = Path(__file__).resolve().parent
+ANGLES = [0, -7, 7, -12, 12]
+OCR_ALLOWLIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+# cascade: dừng sớm khi text khớp regex và mọi box có conf >= ngưỡng này
+USE_CASCADE = True
+CASCADE_MIN_CONF = 0.6
+PASS_ORDER_FILE = BASE / "runs" / "ocr_pass_order.json"
+OCR_BATCH_SIZE = 32
+# lượt OCR đầu cách 1 biển đã biết (PlateIndex) <= 1 ký tự và mọi box conf >= ngưỡng này
+# -> dùng luôn biển đó, bỏ các lượt variant/góc còn lại và nhánh tách 2 dòng
+SNAP_MIN_CONF = 0.4
+# crop đã do YOLO định vị -> bỏ CRAFT (text detector) của EasyOCR, đưa thẳng vào recognizer
+# với box từng dòng; False = readtext đầy đủ như cũ
+OCR_DETECTOR_FREE = True
+TWO_LINE_ASPECT = 2.0   # w/h nhỏ hơn -> biển vuông, thử cắt 2 dòng
 
 # --------- utils ----------
 def find_first_image(folder: Path) -> Path | None:
@@ -74,43 +92,386 @@ def prep_variants(crop_bgr):
     out.append(cv2.morphologyEx(255-thr, cv2.MORPH_CLOSE, k, iterations=1))
     return out
 
-def split_two_lines(crop_bgr):
-    g = cv2.cvtColor(crop_bgr, cv2.COLOR_BGR2GRAY)
+class PrepEngine:
+    """
+    prep_variants / rotate không cấp phát lại cho đường nóng:
+    - CLAHE, kernel, ma trận xoay tạo 1 lần (ma trận cache theo (w, h, góc))
+    - ảnh ra ghi vào buffer dựng sẵn theo bucket kích thước (làm tròn lên BUCKET px),
+      trả về view [:h, :w] -> chỉ hợp lệ tới lần gọi kế tiếp cùng slot.
+    Cần giữ nhiều kết quả cùng lúc (vd cả batch) thì dùng slot khác nhau.
+    Không thread-safe: mỗi thread 1 engine (xem engine()).
+    """
+    BUCKET = 64
+    MAX_BUFFERS = 256
+    MAX_MATRICES = 4096
+
+    def __init__(self):
+        self.clahe = cv2.createCLAHE(2.0, (8,8))
+        self.k_close = np.ones((2,2), np.uint8)
+        self._bufs: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._rot: dict[tuple, np.ndarray] = {}
+
+    def _buf(self, tag, h, w, c=1, slot=0):
+        B = self.BUCKET
+        H, W = -(-h // B) * B, -(-w // B) * B
+        key = (tag, slot, H, W, c)
+        b = self._bufs.get(key)
+        if b is None:
+            b = self._bufs[key] = np.empty((H, W, c) if c > 1 else (H, W), np.uint8)
+            while len(self._bufs) > self.MAX_BUFFERS:
+                self._bufs.popitem(last=False)   # view đang dùng vẫn giữ buffer cũ sống
+        else:
+            self._bufs.move_to_end(key)
+        return b[:h, :w]
+
+    def variants(self, crop_bgr, slot=0):
+        """5 variant như prep_variants (cùng thứ tự, trùng từng byte — xem check_prep_engine)
+        nhưng trả view trong buffer của engine."""
+        h, w = crop_bgr.shape[:2]
+        scale = max(2.0, 300 / max(1, min(h, w)))
+        # fx/fy như prep_variants: dsize tường minh làm OpenCV nội suy theo tỉ lệ bw/w khác scale
+        bh, bw = int(round(h * scale)), int(round(w * scale))
+        big = cv2.resize(crop_bgr, (0, 0), dst=self._buf("big", bh, bw, 3, slot),
+                         fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+        bh, bw = big.shape[:2]                   # cv2 tự cấp phát lại nếu làm tròn khác buffer
+        g = cv2.cvtColor(big, cv2.COLOR_BGR2GRAY, dst=self._buf("gray", bh, bw, 1, slot))
+        g = self.clahe.apply(g, dst=self._buf("clahe", bh, bw, 1, slot))
+        thr = cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 25, 10,
+                                    dst=self._buf("thr", bh, bw, 1, slot))
+        inv = cv2.bitwise_not(thr, dst=self._buf("inv", bh, bw, 1, slot))
+        c1 = cv2.morphologyEx(thr, cv2.MORPH_CLOSE, self.k_close, iterations=1,
+                              dst=self._buf("close", bh, bw, 1, slot))
+        c2 = cv2.morphologyEx(inv, cv2.MORPH_CLOSE, self.k_close, iterations=1,
+                              dst=self._buf("close_inv", bh, bw, 1, slot))
+        return [g, thr, inv, c1, c2]
+
+    def binarize(self, crop_bgr, block=31, C=10, slot=0):
+        """gray -> CLAHE -> adaptive threshold trên crop gốc (không phóng to)."""
+        h, w = crop_bgr.shape[:2]
+        g = cv2.cvtColor(crop_bgr, cv2.COLOR_BGR2GRAY, dst=self._buf("b_gray", h, w, 1, slot))
+        g = self.clahe.apply(g, dst=self._buf("b_clahe", h, w, 1, slot))
+        return cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                     block, C, dst=self._buf("b_thr", h, w, 1, slot))
+
+    def rotate(self, im, ang, slot=0):
+        if ang == 0:
+            return im
+        h, w = im.shape[:2]
+        M = self._rot.get((w, h, ang))
+        if M is None:
+            if len(self._rot) >= self.MAX_MATRICES:
+                self._rot.clear()
+            M = self._rot[(w, h, ang)] = cv2.getRotationMatrix2D((w/2, h/2), ang, 1.0)
+        out = self._buf("rot", h, w, im.shape[2] if im.ndim == 3 else 1, slot)
+        return cv2.warpAffine(im, M, (w, h), dst=out, flags=cv2.INTER_CUBIC,
+                              borderMode=cv2.BORDER_REPLICATE)
+
+def check_prep_engine(crops) -> list[int]:
+    """Chỉ số các crop mà PrepEngine.variants khác prep_variants (so từng byte cả 5 variant)."""
+    eng = PrepEngine()
+    bad = []
+    for i, c in enumerate(crops):
+        got = eng.variants(c)
+        if any(a.shape != b.shape or not np.array_equal(a, b) for a, b in zip(prep_variants(c), got)):
+            bad.append(i)
+    return bad
+
+_TLS = threading.local()
+
+def engine() -> PrepEngine:
+    """PrepEngine riêng của thread hiện tại."""
+    eng = getattr(_TLS, "engine", None)
+    if eng is None:
+        eng = _TLS.engine = PrepEngine()
+    return eng
+
+def _line_cut(im):
+    """Hàng cắt giữa 2 dòng chữ (ảnh BGR hoặc xám), None nếu không tách được."""
+    g = im if im.ndim == 2 else cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
     g = cv2.GaussianBlur(g, (3,3), 0)
     binv = cv2.adaptiveThreshold(g,255,cv2.ADAPTIVE_THRESH_MEAN_C,cv2.THRESH_BINARY_INV,25,10)
     hist = binv.sum(axis=1).astype(np.float32)
     h = binv.shape[0]
     s, e = int(0.35*h), int(0.65*h)
-    if e - s < 10: return None, None
+    if e - s < 10: return None
     cut = s + int(np.argmin(hist[s:e]))
     if cut <= 10 or h-cut <= 10:
+        return None
+    return cut
+
+def split_two_lines(crop_bgr):
+    cut = _line_cut(crop_bgr)
+    if cut is None:
         return None, None
     return crop_bgr[:cut, :], crop_bgr[cut:, :]
 
+def line_boxes(im):
+    """Box [x_min, x_max, y_min, y_max] từng dòng cho reader.recognize: biển vuông -> 2 dòng."""
+    h, w = im.shape[:2]
+    if w < TWO_LINE_ASPECT * h:
+        cut = _line_cut(im)
+        if cut is not None:
+            return [[0, w, 0, cut], [0, w, cut, h]]
+    return [[0, w, 0, h]]
+
 # --------- OCR (EasyOCR) ----------
-def ocr_easy_multi(reader: easyocr.Reader, images):
+def rotate(im, ang):
+    if ang == 0:
+        return im
+    (h, w) = im.shape[:2]
+    M = cv2.getRotationMatrix2D((w/2, h/2), ang, 1.0)
+    return cv2.warpAffine(im, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+def _gray(im):
+    return im if im.ndim == 2 else cv2.cvtColor(im, cv2.COLOR_BGR2GRAY)
+
+def recognize_lines(reader: easyocr.Reader, im, boxes=None, allowlist=OCR_ALLOWLIST):
+    """Chỉ chạy recognizer trên các box dòng (mặc định line_boxes), không qua CRAFT.
+    Trả giống readtext(detail=1): [(box, text, conf)] theo thứ tự trên -> dưới."""
+    return _recognize_boxes(reader, [(_gray(im), boxes or line_boxes(im), [])],
+                            OCR_BATCH_SIZE, allowlist)[0]
+
+def recognize_lines_batched(reader: easyocr.Reader, ims, batch_size: int = OCR_BATCH_SIZE,
+                            allowlist=OCR_ALLOWLIST):
+    """recognize_lines cho nhiều ảnh: ảnh dòng của mọi ảnh vào chung 1 image_list của get_text
+    (cắt thẳng từ từng ảnh, không ghép canvas). Trả list kết quả theo ảnh."""
+    if not ims:
+        return []
+    return _recognize_boxes(reader, [(_gray(im), line_boxes(im), []) for im in ims],
+                            batch_size, allowlist)
+
+def _readtext(reader: easyocr.Reader, im):
+    if OCR_DETECTOR_FREE:
+        return recognize_lines(reader, im)
+    return reader.readtext(
+        im, detail=1,
+        allowlist=OCR_ALLOWLIST,
+        paragraph=False, text_threshold=0.5, low_text=0.3, link_threshold=0.3,
+    )
+
+def _snap(index: PlateIndex | None, res):
+    """Kết quả 1 lượt OCR khớp biển đã biết (<= 1 ký tự, conf đủ) -> biển đó, không thì None."""
+    if index is None or not res or min(t[2] for t in res) < SNAP_MIN_CONF:
+        return None
+    hit = index.snap(" ".join(t[1] for t in res))
+    if hit:
+        metrics.inc("btl_snap_total")
+    return hit
+
+def ocr_easy_multi(reader: easyocr.Reader, images, index: PlateIndex | None = None):
     best_text, best_score = "", -1
-    for im in images:
-        for ang in [0, -7, 7, -12, 12]:
-            if ang != 0:
-                (h, w) = im.shape[:2]
-                M = cv2.getRotationMatrix2D((w/2, h/2), ang, 1.0)
-                im2 = cv2.warpAffine(im, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-            else:
-                im2 = im
-            res = reader.readtext(
-                im2, detail=1,
-                allowlist='0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ',
-                paragraph=False, text_threshold=0.5, low_text=0.3, link_threshold=0.3,
-            )
+    eng = engine()
+    n = 0
+    with metrics.span(stage="ocr_easy_multi"):
+        for im, ang in ((im, ang) for im in images for ang in ANGLES):
+            res = _readtext(reader, eng.rotate(im, ang)); n += 1
+            if n == 1 and (hit := _snap(index, res)):
+                best_text = hit
+                break
             raw = " ".join([t[1] for t in res]) if res else ""
             sc = score_text(raw)
             if sc > best_score:
                 best_score, best_text = sc, raw
+    metrics.inc("btl_ocr_passes_total", n, fn="multi")
     return best_text
 
+def pad_batch(images):
+    """Pad (replicate, phía phải/dưới) mọi ảnh về cùng cỡ để xếp thành 1 batch."""
+    H = max(im.shape[0] for im in images)
+    W = max(im.shape[1] for im in images)
+    return [im if im.shape[:2] == (H, W) else
+            cv2.copyMakeBorder(im, 0, H-im.shape[0], 0, W-im.shape[1], cv2.BORDER_REPLICATE)
+            for im in images]
+
+OCR_IMG_H = 64   # chiều cao ảnh dòng đưa vào recognizer của EasyOCR (easyocr.easyocr.imgH)
+
+def _recognize_boxes(reader: easyocr.Reader, items, batch_size: int = OCR_BATCH_SIZE,
+                     allowlist=OCR_ALLOWLIST):
+    """items: [(ảnh xám, horizontal_list, free_list)] -> mọi box của mọi ảnh vào chung 1 lần
+    easyocr.recognition.get_text (batch_size dòng / lượt mạng).
+    Không qua Reader.recognize: trên CPU hàm đó luôn chạy từng box một, bỏ qua batch_size.
+    Trả [(box, text, conf)] theo từng ảnh (bỏ box không đọc ra chữ)."""
+    from easyocr.recognition import get_text
+    from easyocr.utils import get_image_list
+    image_list, owner, max_w = [], [], OCR_IMG_H
+    for i, (grey, hz, fr) in enumerate(items):
+        lst, w = get_image_list(hz, fr, grey, model_height=OCR_IMG_H)
+        image_list += lst; owner += [i] * len(lst)
+        max_w = max(max_w, w)
+    out = [[] for _ in items]
+    if not image_list:
+        return out
+    ignore = "".join(set(reader.character) - set(allowlist))
+    res = get_text(reader.character, OCR_IMG_H, int(max_w), reader.recognizer, reader.converter,
+                   image_list, ignore_char=ignore, batch_size=batch_size, workers=0,
+                   device=reader.device)
+    for i, r in zip(owner, res):
+        if r[1]:
+            out[i].append(tuple(r))
+    return out
+
+def readtext_batched(reader: easyocr.Reader, ims, batch_size: int = OCR_BATCH_SIZE,
+                     allowlist=OCR_ALLOWLIST, **detect_kw):
+    """Như Reader.readtext_batched: CRAFT chạy 1 lô trên các ảnh đã pad_batch, nhưng recognizer
+    cũng chỉ 1 lượt cho mọi box của mọi ảnh (_recognize_boxes), kể cả trên CPU."""
+    from easyocr.utils import reformat_input_batched
+    if not ims:
+        return []
+    img, grey = reformat_input_batched(pad_batch(ims))
+    hz, fr = reader.detect(img, reformat=False, **detect_kw)
+    return _recognize_boxes(reader, list(zip(grey, hz, fr)), batch_size, allowlist)
+
+def _readtext_batched(reader: easyocr.Reader, ims, batch_size: int):
+    if not ims:
+        return []
+    if OCR_DETECTOR_FREE:
+        metrics.inc("btl_ocr_passes_total", len(ims), fn="batched")
+        return recognize_lines_batched(reader, ims, batch_size)
+    results = readtext_batched(reader, ims, batch_size,
+                               text_threshold=0.5, low_text=0.3, link_threshold=0.3)
+    metrics.inc("btl_ocr_passes_total", len(ims), fn="batched")
+    return results
+
+def ocr_easy_batched(reader: easyocr.Reader, groups, batch_size: int = OCR_BATCH_SIZE,
+                     index: PlateIndex | None = None):
+    """Bản batch của ocr_easy_multi cho nhiều crop cùng lúc.
+    groups: mỗi phần tử là list variant (prep_variants) của 1 crop.
+    Mọi variant x góc của mọi crop đi chung 1 lần readtext_batched (recognizer 1 lượt cho mọi box); trả list text tốt nhất theo crop.
+    Có index: chạy trước 1 batch lượt đầu (variant 0, góc 0), crop nào khớp biển đã biết thì xong luôn."""
+    best = [("", -1.0) for _ in groups]
+    snapped = set()
+
+    def keep(gi, res):
+        raw = " ".join([t[1] for t in res]) if res else ""
+        sc = score_text(raw)
+        if sc > best[gi][1]:
+            best[gi] = (raw, sc)
+
+    with metrics.span(stage="ocr_easy_batched"):
+        if index is not None:
+            firsts = [gi for gi, images in enumerate(groups) if images]
+            for gi, res in zip(firsts, _readtext_batched(reader, [groups[gi][0] for gi in firsts],
+                                                         batch_size)):
+                hit = _snap(index, res)
+                if hit:
+                    best[gi] = (hit, float("inf")); snapped.add(gi)
+                else:
+                    keep(gi, res)
+        ims, owner = [], []
+        eng = engine()
+        for gi, images in enumerate(groups):
+            if gi in snapped:
+                continue
+            for vi, im in enumerate(images):
+                for ang in ANGLES:
+                    if index is not None and vi == 0 and ang == 0:
+                        continue                 # đã chạy ở lượt đầu
+                    ims.append(eng.rotate(im, ang, slot=len(ims))); owner.append(gi)
+        for gi, res in zip(owner, _readtext_batched(reader, ims, batch_size)):
+            keep(gi, res)
+    return [t for t, _ in best]
+
+class PassOrder:
+    """Thống kê số lần thắng của từng lượt (variant, góc) -> thứ tự thử cho cascade.
+    Hoà thì giữ thứ tự mặc định (variant trước, góc theo ANGLES)."""
+    def __init__(self, n_variants=5, angles=ANGLES):
+        self.keys = [(v, a) for v in range(n_variants) for a in angles]
+        self.wins = {k: 0 for k in self.keys}
+
+    def order(self):
+        return sorted(self.keys, key=lambda k: -self.wins[k])  # sort ổn định
+
+    def record(self, key):
+        if key in self.wins:
+            self.wins[key] += 1
+
+    def save(self, path: Path = PASS_ORDER_FILE):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps([[v, a, n] for (v, a), n in self.wins.items()]))
+
+    @classmethod
+    def load(cls, path: Path = PASS_ORDER_FILE, n_variants=5, angles=ANGLES):
+        po = cls(n_variants, angles)
+        if path.exists():
+            for v, a, n in json.loads(path.read_text()):
+                if (v, a) in po.wins:
+                    po.wins[(v, a)] = n
+        return po
+
+def ocr_easy_cascade(reader: easyocr.Reader, images, order: PassOrder | None = None,
+                     min_conf: float = CASCADE_MIN_CONF, index: PlateIndex | None = None):
+    """Như ocr_easy_multi nhưng thử theo thứ tự tỉ lệ thắng và dừng ngay khi
+    text khớp VN_PLATE_REGEX với conf mọi box >= min_conf (hoặc lượt đầu khớp biển trong index).
+    Trả (text, (variant, góc)) của lượt thắng; ("", None) nếu không đọc được gì."""
+    keys = order.order() if order else [(v, a) for v in range(len(images)) for a in ANGLES]
+    best_text, best_score, best_key = "", -1, None
+    n, early = 0, False
+    eng = engine()
+    with metrics.span(stage="ocr_easy_cascade"):
+        for vi, ang in keys:
+            if vi >= len(images):
+                continue
+            res = _readtext(reader, eng.rotate(images[vi], ang)); n += 1
+            if n == 1 and (hit := _snap(index, res)):
+                best_text, best_key, early = hit, (vi, ang), True
+                break
+            raw = " ".join([t[1] for t in res]) if res else ""
+            sc = score_text(raw)
+            if sc > best_score:
+                best_score, best_text, best_key = sc, raw, (vi, ang)
+            if res and VN_PLATE_REGEX.search(normalize_text(raw)) and min(t[2] for t in res) >= min_conf:
+                best_text, best_key, early = raw, (vi, ang), True
+                break
+    metrics.inc("btl_ocr_passes_total", n, fn="cascade")
+    metrics.inc("btl_cascade_total", exit="early" if early else "full")
+    if order and best_text:
+        order.record(best_key)
+    return best_text, (best_key if best_text else None)
+
+def read_plates(reader: easyocr.Reader, crops, order: PassOrder | None = None,
+                cascade: bool = USE_CASCADE, tags=None, index: PlateIndex | None = None) -> list[str]:
+    """OCR nhiều crop đã nắn: mọi variant (cascade từng crop, hoặc 1 batch cho mọi crop),
+    crop nào yếu thì tách 2 dòng (các nửa cũng đi chung 1 batch).
+    tags: tên ảnh theo crop, ghi vào metrics khi phải dùng nhánh tách 2 dòng.
+    index: biển đã biết -> crop khớp ngay lượt đầu thì trả luôn (không bao giờ bị coi là yếu)."""
+    if cascade:
+        ocr = lambda groups, idx=None: [ocr_easy_cascade(reader, ims, order, index=idx)[0]
+                                        for ims in groups]
+    else:
+        ocr = lambda groups, idx=None: ocr_easy_batched(reader, groups, index=idx)
+    eng = engine()
+    texts = ocr([eng.variants(c, slot=i) for i, c in enumerate(crops)], index)
+    tags = tags or [None] * len(crops)
+
+    # nếu yếu → thử tách 2 dòng
+    weak, halves = [], []
+    for i, (crop, text_raw) in enumerate(zip(crops, texts)):
+        if len(normalize_text(text_raw)) >= 6:
+            continue
+        t, b = split_two_lines(crop)
+        metrics.inc("btl_two_line_fallback_total", split="yes" if t is not None else "no")
+        metrics.note("two_line_fallback", image=tags[i], first=text_raw, split=t is not None)
+        if t is not None:
+            k = 2 * len(weak)                        # mỗi nửa 1 slot riêng (cả lô OCR cùng lúc)
+            weak.append(i); halves += [eng.variants(t, slot=k), eng.variants(b, slot=k + 1)]
+    if weak:
+        with metrics.span(stage="two_line_fallback"):
+            parts = ocr(halves)
+        for k, i in enumerate(weak):
+            t1, t2 = parts[2*k], parts[2*k+1]
+            texts[i] = max([texts[i], t1+t2, f"{t1} {t2}"], key=score_text)
+    return texts
+
+def read_plate(reader: easyocr.Reader, crop, order: PassOrder | None = None,
+               cascade: bool = USE_CASCADE, tag: str | None = None,
+               index: PlateIndex | None = None) -> str:
+    return read_plates(reader, [crop], order, cascade, [tag], index)[0]
+
 # ===================== MAIN =====================
 if __name__ == "__main__":
+    import easyocr
+    from Controller.backend import load_detector
+
     # chọn ảnh & model tự động
     img_dir = BASE / "datasets" / "test" / "images"
     img_path = find_first_image(img_dir)
@@ -123,54 +484,48 @@ if __name__ == "__main__":
     print(f"Using model: {model_path}")
 
     # 1) Detect
-    model = YOLO(model_path.as_posix())
-    det = model.predict(source=img_path.as_posix(), conf=0.25, device=0, verbose=False)[0]
+    model, device = load_detector(model_path)
+    det = model.predict(source=img_path.as_posix(), conf=0.25, device=device, verbose=False)[0]
     if len(det.boxes) == 0:
         print("Không tìm thấy biển số"); exit(0)
-    i_best = int(det.boxes.conf.argmax())
-    xyxy = det.boxes.xyxy[i_best].tolist()
-    conf = float(det.boxes.conf[i_best])
-    print("BBox:", xyxy, "Conf:", conf)
+    # giữ mọi box (đã qua NMS + ngưỡng conf), conf giảm dần
+    order_idx = det.boxes.conf.argsort(descending=True).tolist()
+    boxes = [(det.boxes.xyxy[i].tolist(), float(det.boxes.conf[i])) for i in order_idx]
+    for xyxy, conf in boxes:
+        print("BBox:", xyxy, "Conf:", conf)
 
     # 2) Crop + nắn + phóng to
     img = cv2.imread(img_path.as_posix())
-    crop = crop_expand(img, xyxy, expand=0.12)
-    crop = deskew_by_min_area_rect(crop)
+    crops = [deskew_by_min_area_rect(crop_expand(img, xyxy, expand=0.12)) for xyxy, _ in boxes]
 
-    # 3) EasyOCR
+    # 3) EasyOCR (mọi crop 1 lượt)
     try:
         reader = easyocr.Reader(['en'], gpu=True)
     except Exception:
         reader = easyocr.Reader(['en'], gpu=False)
 
-    preps = prep_variants(crop)
-    text_raw = ocr_easy_multi(reader, preps)
-
-    # 3b) nếu yếu → thử tách 2 dòng
-    if len(normalize_text(text_raw)) < 6:
-        t, b = split_two_lines(crop)
-        if t is not None:
-            t1 = ocr_easy_multi(reader, prep_variants(t))
-            t2 = ocr_easy_multi(reader, prep_variants(b))
-            cand = [text_raw, t1+t2, f"{t1} {t2}"]
-            text_raw = max(cand, key=score_text)
-
-    text_norm = normalize_text(text_raw)
-    m = VN_PLATE_REGEX.search(text_norm)
-    final_text = m.group(0) if m else text_norm
-
-    print("OCR raw:", text_raw.strip())
-    print("Biển số:", final_text)
+    order = PassOrder.load() if USE_CASCADE else None
+    texts_raw = read_plates(reader, crops, order, tags=[img_path.name] * len(crops))
+    if order:
+        order.save()
 
     # 4) Hiển thị
-    x1,y1,x2,y2 = map(int, xyxy)
     vis = img.copy()
-    cv2.rectangle(vis, (x1,y1), (x2,y2), (0,255,0), 2)
-    cv2.putText(vis, final_text, (x1, max(0,y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2, cv2.LINE_AA)
+    for k, ((xyxy, _), text_raw) in enumerate(zip(boxes, texts_raw)):
+        text_norm = normalize_text(text_raw)
+        m = VN_PLATE_REGEX.search(text_norm)
+        final_text = m.group(0) if m else text_norm
+        print(f"[{k}] OCR raw:", text_raw.strip())
+        print(f"[{k}] Biển số:", final_text)
+
+        x1,y1,x2,y2 = map(int, xyxy)
+        cv2.rectangle(vis, (x1,y1), (x2,y2), (0,255,0), 2)
+        cv2.putText(vis, final_text, (x1, max(0,y1-10)), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2, cv2.LINE_AA)
 
     cv2.imshow("Anh goc", img)
     cv2.imshow("BBox + Text", vis)
-    cv2.imshow("Crop", crop)
-    for i, p in enumerate(preps[:3]):
+    for k, crop in enumerate(crops):
+        cv2.imshow(f"Crop {k}", crop)
+    for i, p in enumerate(prep_variants(crops[0])[:3]):
         cv2.imshow(f"Prep {i}", p)
     cv2.waitKey(0); cv2.destroyAllWindows()
@@ -0,0 +1,302 @@
+# ingest.py  (theo dõi thư mục ảnh camera: nhận diện + lưu lịch sử, chạy nền không GUI)
+from __future__ import annotations
+import argparse, json, os, queue, signal, sys, threading, time
+from pathlib import Path
+
+from batch import IMG_EXTS, ResultWriter
+from Controller.ctl import A_ctl, save_history
+from Controller.frame import ImageFrame
+from Model.Data import sql
+import metrics
+
+# ===== Config =====
+QUEUE_MAX = 64          # số file chờ nhận diện tối đa (đầy -> thread settle đứng chờ = backpressure)
+BATCH     = 8           # số ảnh mỗi lần gọi recognize_all_batch
+SETTLE_S  = 1.0         # size + mtime đứng yên ngần này giây mới coi là camera đã ghi xong
+POLL_S    = 2.0         # chu kỳ quét thư mục khi không có watchdog
+RESCAN_S  = 60.0        # có watchdog vẫn quét lại định kỳ (bù sự kiện bị mất / bị bỏ khi quá tải)
+MAX_CANDIDATES = 10000  # số file đang chờ ổn định tối đa; vượt thì bỏ, lần quét sau nhặt lại
+
+class Ingest:
+    """
+    watcher (watchdog = inotify/ReadDirectoryChangesW, không có thì quét định kỳ)
+      -> _cand: file mới, chờ size + mtime đứng yên SETTLE_S giây
+      -> bỏ file đã có trong ledger (cùng Size + MTimeNs; _seen = bản sao trong RAM, nạp 1 lần
+         lúc run()) -> work queue (có giới hạn)
+      -> thread gọi run(): lô <= BATCH ảnh -> A_ctl.recognize_all_batch -> save_history + ledger.
+    Hàng đợi chỉ chứa đường dẫn, ảnh được đọc lúc nhận diện; đợt ảnh dồn về vượt MAX_CANDIDATES
+    thì bỏ bớt (chỉ là gợi ý từ watcher) và để lần quét lại sau nhặt -> bộ nhớ không phình.
+    Ledger ghi sau lichsu: dừng giữa chừng thì lần chạy sau làm lại lô dở (có thể trùng 1 lô, không mất ảnh).
+    """
+    def __init__(self, ctl: A_ctl, root, writer: ResultWriter | None = None, batch: int = BATCH,
+                 queue_max: int = QUEUE_MAX, settle: float = SETTLE_S, poll: float = POLL_S,
+                 use_watchdog: bool = True):
+        self.ctl = ctl
+        self.root = Path(root).resolve()
+        self.writer = writer
+        self.batch = batch
+        self.settle, self.poll = settle, poll
+        self.use_watchdog = use_watchdog
+        self.work: queue.Queue = queue.Queue(maxsize=queue_max)
+        self.stop_evt = threading.Event()
+        self.observer = None
+        self._cand: dict[str, tuple | None] = {}   # path -> (size, mtime_ns, lúc đổi gần nhất)
+        self._busy: set[str] = set()                # đã vào queue, chưa ghi ledger
+        self._seen: dict[str, tuple] = {}           # path -> (size, mtime_ns) đã ghi ledger
+        self._lock = threading.Lock()
+        self._overflow = False
+        self.stats = {"images": 0, "plates": 0, "errors": 0}
+
+    # --- watcher ---
+    def notify(self, path):
+        """Báo có file mới / vừa đổi (từ watchdog hoặc lần quét)."""
+        p = str(path)
+        if Path(p).suffix.lower() not in IMG_EXTS:
+            return
+        with self._lock:
+            if p in self._busy or p in self._cand:
+                return
+            if len(self._cand) >= MAX_CANDIDATES:
+                self._overflow = True
+                metrics.inc("btl_ingest_dropped_total")
+                return
+            self._cand[p] = None
+
+    def _start_watchdog(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+        ing = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, ev):
+                if not ev.is_directory:
+                    ing.notify(getattr(ev, "dest_path", "") or ev.src_path)
+
+        obs = Observer()
+        obs.schedule(_Handler(), str(self.root), recursive=True)
+        obs.start()
+        return obs
+
+    def _scan(self):
+        """Quét cả cây thư mục, thêm file chưa có trong ledger (hoặc đã bị ghi đè) vào _cand.
+        Chỉ so với _seen, không truy vấn CSDL; file rỗng (camera chưa ghi) để lần sau."""
+        found = {}
+        for dirpath, _, names in os.walk(self.root):
+            for n in names:
+                if os.path.splitext(n)[1].lower() in IMG_EXTS:
+                    p = os.path.join(dirpath, n)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    if st.st_size > 0:
+                        found[p] = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            for p in [p for p in self._seen if p not in found]:   # file đã bị xoá
+                del self._seen[p]
+            paths = [p for p, st in found.items()
+                     if p not in self._busy and p not in self._cand and self._seen.get(p) != st]
+        for p in paths:
+            self.notify(p)
+
+    def _settled(self) -> list[tuple[str, int, int]]:
+        """Cập nhật stat các ứng viên; trả những file đã đứng yên đủ SETTLE_S giây
+        và chưa có trong ledger. File vẫn rỗng sau SETTLE_S thì bỏ (ghi tiếp thì được báo lại)."""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            items = list(self._cand.items())
+        for p, old in items:
+            try:
+                st = os.stat(p)
+            except OSError:                       # bị xoá / đổi tên trước khi kịp xử lý
+                with self._lock:
+                    self._cand.pop(p, None)
+                continue
+            cur = (st.st_size, st.st_mtime_ns)
+            if old is None or old[:2] != cur:
+                with self._lock:
+                    self._cand[p] = (*cur, now)
+            elif now - old[2] >= self.settle:
+                with self._lock:
+                    if cur[0] == 0 or self._seen.get(p) == cur:
+                        self._cand.pop(p, None)
+                    else:
+                        ready.append((p, *cur))
+        return ready
+
+    def _enqueue(self, item) -> bool:
+        with self._lock:
+            self._cand.pop(item[0], None)
+            self._busy.add(item[0])
+        while not self.stop_evt.is_set():
+            try:
+                self.work.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                metrics.inc("btl_ingest_backpressure_total")
+        return False
+
+    def _settle_loop(self):
+        tick = min(0.5, self.settle / 2) or 0.1
+        next_scan = last_scan = 0.0
+        while not self.stop_evt.is_set():
+            now = time.monotonic()
+            if now >= next_scan or (self._overflow and now - last_scan >= self.poll):
+                self._overflow = False
+                try:
+                    self._scan()
+                except Exception as e:
+                    print("Ingest scan error:", e, file=sys.stderr)
+                last_scan = now
+                next_scan = now + (self.poll if self.observer is None else RESCAN_S)
+            try:
+                for item in self._settled():
+                    if not self._enqueue(item):
+                        break
+            except Exception as e:
+                print("Ingest settle error:", e, file=sys.stderr)
+            self.stop_evt.wait(tick)
+
+    # --- nhận diện ---
+    def _take(self) -> list:
+        try:
+            items = [self.work.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(items) < self.batch:
+            try:
+                items.append(self.work.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _recognize(self, frames):
+        """Cả lô 1 lần; lô lỗi thì chạy từng ảnh để chỉ ảnh hỏng bị đánh dấu lỗi."""
+        try:
+            return self.ctl.recognize_all_batch(frames)
+        except Exception:
+            out = []
+            for f in frames:
+                try:
+                    out.append(self.ctl.recognize_all(f))
+                except Exception as e:
+                    out.append(e)
+            return out
+
+    def _process(self, items):
+        """Lỗi cả lô (SQLite / đĩa...) không làm chết daemon: file chưa vào ledger,
+        bỏ khỏi _busy để lần quét lại sau nhận lại."""
+        try:
+            self._process_batch(items)
+        except Exception as e:
+            print("Ingest batch error:", e, file=sys.stderr)
+            metrics.inc("btl_ingest_files_total", len(items), result="batch_error")
+            self.stats["errors"] += len(items)
+        finally:
+            with self._lock:
+                self._busy.difference_update(p for p, _, _ in items)
+
+    def _process_batch(self, items):
+        ledger, frames, ok = [], [], []
+        for p, size, mtime in items:
+            f = ImageFrame.open(p)
+            if f is None:
+                ledger.append((p, size, mtime, "loi", 0, "decode"))
+                self._emit({"file": p, "error": "decode"})
+            else:
+                frames.append(f); ok.append((p, size, mtime))
+        with metrics.span(stage="ingest_batch"):
+            results = self._recognize(frames) if frames else []
+        for (p, size, mtime), plates in zip(ok, results):
+            if isinstance(plates, Exception):
+                ledger.append((p, size, mtime, "loi", 0, str(plates)))
+                self._emit({"file": p, "error": str(plates)})
+                continue
+            self.stats["images"] += 1
+            if not plates:
+                self._emit({"file": p, "error": "no_plate"})
+            for k, r in enumerate(plates):
+                rec = {"file": p, "plate_idx": k, "text": r["text"], "raw": r["raw"],
+                       "conf": round(r["conf"], 4), "bbox": list(r["bbox"]),
+                       "det_ms": round(r["det_ms"], 2), "ocr_ms": round(r["ocr_ms"], 2)}
+                if r["text"]:
+                    rec["id"] = save_history(r["text"], r["crop"])
+                self.stats["plates"] += 1
+                self._emit(rec)
+            ledger.append((p, size, mtime, "ok", len(plates), None))
+        sql.ledger_ghi(ledger)
+        with self._lock:
+            self._seen.update((p, (size, mtime)) for p, size, mtime, *_ in ledger)
+        n_err = sum(1 for row in ledger if row[3] == "loi")
+        self.stats["errors"] += n_err
+        metrics.inc("btl_ingest_files_total", len(ledger) - n_err, result="ok")
+        metrics.inc("btl_ingest_files_total", n_err, result="error")
+
+    def _emit(self, row: dict):
+        if self.writer is not None:
+            self.writer.write(row)
+
+    def run(self) -> dict:
+        """Chạy tới khi stop_evt được set (SIGINT/SIGTERM): xong lô đang dở rồi mới thoát;
+        file còn trong queue chưa vào ledger nên lần chạy sau tự nhận lại."""
+        self._seen = sql.ledger_thu_muc(str(self.root))
+        if self.use_watchdog:
+            self.observer = self._start_watchdog()
+        print(f"Theo dõi {self.root} ({'watchdog' if self.observer else f'quét mỗi {self.poll}s'})...",
+              file=sys.stderr)
+        settle = threading.Thread(target=self._settle_loop, name="ingest-settle", daemon=True)
+        settle.start()
+        try:
+            while not self.stop_evt.is_set():
+                items = self._take()
+                if items:
+                    self._process(items)
+        finally:
+            self.stop_evt.set()
+            if self.observer is not None:
+                self.observer.stop(); self.observer.join()
+            settle.join()
+        return self.stats
+
+def install_signals(stop_evt: threading.Event):
+    """SIGINT/SIGTERM lần 1: dừng êm; Ctrl+C lần 2: thoát ngay."""
+    def handler(signum, frame):
+        if stop_evt.is_set():
+            raise KeyboardInterrupt
+        print("Đang dừng, chờ xong lô hiện tại...", file=sys.stderr)
+        stop_evt.set()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, handler)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Theo dõi thư mục ảnh, nhận diện biển số và lưu lịch sử")
+    ap.add_argument("folder", help="thư mục camera ghi ảnh vào (theo dõi cả thư mục con)")
+    ap.add_argument("-o", "--out", default="-", help="file .csv hoặc .jsonl ('-' = stdout)")
+    ap.add_argument("-b", "--batch-size", type=int, default=BATCH)
+    ap.add_argument("--queue", type=int, default=QUEUE_MAX, help="số file chờ nhận diện tối đa")
+    ap.add_argument("--settle", type=float, default=SETTLE_S, help="giây file phải đứng yên")
+    ap.add_argument("--poll", type=float, default=POLL_S, help="chu kỳ quét khi không dùng watchdog")
+    ap.add_argument("--no-watchdog", action="store_true", help="chỉ quét định kỳ (vd thư mục mạng)")
+    ap.add_argument("--model", default=None)
+    args = ap.parse_args()
+
+    if not Path(args.folder).is_dir():
+        sys.exit(f"Không có thư mục: {args.folder}")
+    ctl = A_ctl(model_path=args.model)
+    ctl.ready.wait()
+    if ctl.load_error is not None:
+        sys.exit(f"Nạp model lỗi: {ctl.load_error}")
+
+    writer = ResultWriter(args.out)
+    ing = Ingest(ctl, args.folder, writer, args.batch_size, args.queue, args.settle, args.poll,
+                 use_watchdog=not args.no_watchdog)
+    install_signals(ing.stop_evt)
+    try:
+        stats = ing.run()
+    finally:
+        writer.close()
+    print(json.dumps(stats), file=sys.stderr)
@@ -1,9 +1,21 @@
+import argparse
 from tkinter import Tk
 from Controller.ctl import A_ctl as Controller
 from GUI.mainview import Mainview
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--remote", nargs="?", const="", default=None,
+                    help="dùng model của server.py (host:port hoặc unix:/đường/dẫn.sock) thay vì nạp tại chỗ")
+    ap.add_argument("--cache-db", action="store_true",
+                    help="giữ cache nhận diện trong bien_so.db qua các lần chạy")
+    args = ap.parse_args()
+
     window = Tk()
-    ctl = Controller(model_path=r"runs\detect\train2\weights\best.pt")
+    if args.remote is not None:
+        from Controller.remote import RemoteController
+        ctl = RemoteController(args.remote or None)
+    else:
+        ctl = Controller(model_path=r"runs\detect\train2\weights\best.pt", cache_persist=args.cache_db)
     app = Mainview(window, ctl)
     window.mainloop()
@@ -0,0 +1,153 @@
+# metrics.py  (đếm + đo thời gian trong tiến trình, xuất Prometheus text / JSON)
+from __future__ import annotations
+import atexit, json, os, threading, time
+from collections import deque
+from pathlib import Path
+
+# Bật bằng BTL_METRICS=1 hoặc metrics.enable(). Tắt thì span()/inc() gần như không tốn gì.
+#   BTL_METRICS_FILE=metrics.prom|metrics.json -> ghi khi thoát
+#   BTL_METRICS_PORT=9108                      -> HTTP /metrics và /metrics.json trên 127.0.0.1
+ENABLED = os.environ.get("BTL_METRICS", "") not in ("", "0")
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+_LOCK = threading.Lock()
+_counters: dict[tuple, float] = {}
+_hists: dict[tuple, list] = {}          # key -> [đếm theo bucket..., sum, count]
+_events: deque = deque(maxlen=500)      # sự kiện gần nhất (vd ảnh phải tách 2 dòng)
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def enable(on: bool = True):
+    global ENABLED
+    ENABLED = on
+
+def reset():
+    with _LOCK:
+        _counters.clear(); _hists.clear(); _events.clear()
+
+# ===== ghi nhận =====
+def inc(name: str, n: float = 1, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    with _LOCK:
+        _counters[k] = _counters.get(k, 0) + n
+
+def observe(name: str, ms: float, **labels):
+    if not ENABLED:
+        return
+    k = _key(name, labels)
+    with _LOCK:
+        h = _hists.get(k)
+        if h is None:
+            h = _hists[k] = [0] * len(BUCKETS_MS) + [0.0, 0]
+        for i, b in enumerate(BUCKETS_MS):
+            if ms <= b:
+                h[i] += 1; break
+        h[-2] += ms; h[-1] += 1
+
+def note(kind: str, **fields):
+    """Lưu 1 sự kiện (giữ 500 cái gần nhất) để xem ảnh nào gây ra nhánh tốn kém."""
+    if not ENABLED:
+        return
+    fields.update(kind=kind, t=round(time.time(), 3))
+    with _LOCK:
+        _events.append(fields)
+
+class _Span:
+    __slots__ = ("name", "labels", "t0")
+    def __init__(self, name, labels):
+        self.name, self.labels = name, labels
+    def __enter__(self):
+        self.t0 = time.perf_counter(); return self
+    def __exit__(self, *exc):
+        observe(self.name, (time.perf_counter() - self.t0) * 1000, **self.labels)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+_NOSPAN = _NoSpan()
+
+def span(name: str = "btl_stage_ms", **labels):
+    """with metrics.span(stage="ocr"): ...  -> histogram thời gian (ms)."""
+    return _Span(name, labels) if ENABLED else _NOSPAN
+
+# ===== xuất =====
+def _fmt_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def to_prometheus() -> str:
+    lines = []
+    with _LOCK:
+        counters = dict(_counters); hists = {k: list(v) for k, v in _hists.items()}
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), v in counters.items():
+            if n == name:
+                lines.append(f"{name}{_fmt_labels(labels)} {v:g}")
+    for name in sorted({k[0] for k in hists}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), h in hists.items():
+            if n != name:
+                continue
+            acc = 0
+            for b, c in zip(BUCKETS_MS, h):
+                acc += c
+                le = "+Inf" if b == float("inf") else f"{b:g}"
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', le)])} {acc}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]:.3f}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {h[-1]}")
+    return "\n".join(lines) + "\n"
+
+def to_json() -> dict:
+    with _LOCK:
+        return {
+            "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in _counters.items()],
+            "histograms": [{"name": n, "labels": dict(l), "count": h[-1], "sum_ms": round(h[-2], 3),
+                            "mean_ms": round(h[-2] / h[-1], 3) if h[-1] else None,
+                            "buckets": {("+Inf" if b == float("inf") else f"{b:g}"): c
+                                        for b, c in zip(BUCKETS_MS, h)}}
+                           for (n, l), h in _hists.items()],
+            "events": list(_events),
+        }
+
+def dump(path: str | Path):
+    """.json -> JSON, còn lại -> Prometheus text."""
+    p = Path(path)
+    data = json.dumps(to_json(), ensure_ascii=False, indent=2) if p.suffix == ".json" else to_prometheus()
+    p.write_text(data, encoding="utf-8")
+
+def serve(port: int = 9108, host: str = "127.0.0.1"):
+    """HTTP endpoint cục bộ trên thread nền: /metrics (Prometheus), /metrics.json."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _H(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(to_json(), ensure_ascii=False).encode(), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = to_prometheus().encode(), "text/plain; version=0.0.4"
+            else:
+                self.send_error(404); return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer((host, port), _H)
+    threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+    return srv
+
+if ENABLED and os.environ.get("BTL_METRICS_FILE"):
+    atexit.register(dump, os.environ["BTL_METRICS_FILE"])
+if ENABLED and os.environ.get("BTL_METRICS_PORT"):
+    serve(int(os.environ["BTL_METRICS_PORT"]))
@@ -0,0 +1,227 @@
+# server.py  (dịch vụ nhận diện cục bộ: 1 bộ model cho nhiều máy trạm, gom request thành lô)
+from __future__ import annotations
+import argparse, os, queue, signal, socket, socketserver, sys, threading, time
+
+from Controller.ctl import A_ctl
+from Controller.frame import ImageFrame
+from Controller.remote import DEFAULT_ADDR, parse_address, recv_msg, send_msg
+import metrics
+
+# ===== Config =====
+MAX_BATCH = 8        # số ảnh tối đa mỗi lần gọi recognize_all_batch
+BUDGET_MS = 15.0     # request đầu tiên của lô chờ tối đa ngần này ms để gom thêm
+QUEUE_MAX = 64       # số ảnh chờ tối đa (đầy -> thread kết nối ngừng đọc socket = backpressure)
+OUTBOX_MAX = 256     # số trả lời chờ gửi tối đa mỗi kết nối (client không đọc -> cắt kết nối)
+
+def _pack(p: dict) -> dict:
+    """Bỏ crop (client tự cắt lại từ ảnh của nó), ép kiểu numpy -> JSON."""
+    return {"text": p["text"], "raw": p["raw"], "conf": float(p["conf"]),
+            "ocr_conf": float(p["ocr_conf"]), "bbox": [int(v) for v in p["bbox"]],
+            "det_ms": float(p["det_ms"]), "ocr_ms": float(p["ocr_ms"]),
+            "cached": bool(p.get("cached", False))}
+
+def _pack_read(r: dict) -> dict:
+    return {"text": r["text"], "raw": r["raw"], "ocr_conf": float(r["ocr_conf"])}
+
+# ===== Gom lô =====
+class MicroBatcher:
+    """
+    1 thread duy nhất gọi model. Lấy request đầu tiên, gom thêm tới khi đủ max_batch
+    hoặc hết budget_ms tính từ lúc request đó tới (request đã chờ lâu thì không chờ thêm).
+    Máy đang bận chạy lô trước thì request dồn lại trong queue -> lô sau tự lớn lên.
+    """
+    def __init__(self, ctl: A_ctl, max_batch: int = MAX_BATCH, budget_ms: float = BUDGET_MS,
+                 max_queue: int = QUEUE_MAX):
+        self.ctl = ctl
+        self.max_batch = max_batch
+        self.budget = budget_ms / 1000
+        self.q: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: ImageFrame, done, kind: str = "frame"):
+        """kind "frame": ảnh đầy đủ -> done(plates | None, error | None);
+        kind "crop": crop biển -> done({text, raw, ocr_conf} | None, error | None).
+        done được gọi trên thread gom lô."""
+        self.q.put((time.perf_counter(), frame, done, kind))
+
+    def _collect(self) -> tuple[list, bool]:
+        first = self.q.get()
+        if first is None:
+            return [], True
+        batch, deadline = [first], first[0] + self.budget
+        while len(batch) < self.max_batch:
+            left = deadline - time.perf_counter()
+            try:
+                item = self.q.get(timeout=left) if left > 0 else self.q.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._collect()
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            for t, *_ in batch:
+                metrics.observe("btl_server_wait_ms", (t0 - t) * 1000)
+            metrics.inc("btl_server_batches_total")
+            metrics.inc("btl_server_requests_total", len(batch))
+            with metrics.span(stage="server_batch"):
+                results = self._recognize(batch)
+            for (_, _, done, _), plates in zip(batch, results):
+                try:
+                    if isinstance(plates, Exception):
+                        done(None, str(plates))
+                    else:
+                        done(plates, None)
+                except Exception as e:
+                    print("Server reply error:", e, file=sys.stderr)
+
+    def _recognize(self, batch):
+        """Ảnh -> recognize_all_batch, crop -> read_crops; mỗi loại 1 lần cho cả lô.
+        Lô lỗi thì chạy từng mục để mỗi client chỉ nhận lỗi của mục mình."""
+        out = [None] * len(batch)
+        for kind, run in (("frame", self.ctl.recognize_all_batch),
+                          ("crop", lambda fs: self.ctl.read_crops([f.full() for f in fs]))):
+            idx = [i for i, item in enumerate(batch) if item[3] == kind]
+            if not idx:
+                continue
+            frames = [batch[i][1] for i in idx]
+            try:
+                res = run(frames)
+            except Exception:
+                metrics.inc("btl_server_batch_errors_total")
+                res = []
+                for f in frames:
+                    try:
+                        res.append(run([f])[0])
+                    except Exception as e:
+                        res.append(e)
+            for i, r in zip(idx, res):
+                out[i] = r
+        return out
+
+    def stop(self):
+        self.q.put(None)
+        self._thread.join()
+
+# ===== Kết nối =====
+class _Handler(socketserver.BaseRequestHandler):
+    """Mỗi kết nối 2 thread: thread này chỉ đọc request và đẩy vào MicroBatcher, không chờ kết quả
+    (client gửi liền nhiều ảnh thì cả loạt vào chung 1 lô); thread ghi lấy trả lời từ outbox.
+    Thread gom lô chỉ bỏ trả lời vào outbox, không bao giờ chờ socket -> client chậm không kéo
+    cả server chậm theo."""
+    def handle(self):
+        sock, srv = self.request, self.server
+        outbox: queue.Queue = queue.Queue(maxsize=OUTBOX_MAX)
+
+        def write():
+            while (obj := outbox.get()) is not None:
+                try:
+                    send_msg(sock, obj)
+                except OSError:
+                    return                        # client đã đóng
+        writer = threading.Thread(target=write, name="server-writer", daemon=True)
+        writer.start()
+
+        def reply(obj):
+            try:
+                outbox.put_nowait(obj)
+            except queue.Full:                    # client không đọc trả lời -> cắt kết nối
+                metrics.inc("btl_server_slow_client_total")
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        try:
+            self._serve(sock, srv, reply)
+        finally:
+            try:
+                outbox.put(None, timeout=1.0)     # gửi nốt trả lời đã có rồi mới đóng
+            except queue.Full:
+                pass
+            writer.join(timeout=5)
+
+    def _serve(self, sock, srv, reply):
+        """Đọc request tới khi client đóng kết nối."""
+        while True:
+            try:
+                msg = recv_msg(sock)
+            except (OSError, ValueError):
+                return
+            if msg is None:
+                return
+            req, blob = msg
+            rid, op = req.get("id"), req.get("op")
+            if op == "hello":
+                srv.ctl.ready.wait()
+                err = srv.ctl.load_error
+                reply({"id": rid, "ready": err is None, "error": str(err) if err else None})
+            elif op in ("recognize", "read"):
+                f = ImageFrame.from_bytes(blob)
+                if f is None:
+                    reply({"id": rid, "error": "Không đọc được ảnh!"})
+                elif op == "recognize":
+                    srv.batcher.submit(f, lambda plates, err, rid=rid: reply(
+                        {"id": rid, "error": err} if err else {"id": rid, "plates": [_pack(p) for p in plates]}))
+                else:
+                    srv.batcher.submit(f, lambda r, err, rid=rid: reply(
+                        {"id": rid, "error": err} if err else {"id": rid, "read": _pack_read(r)}), kind="crop")
+            else:
+                reply({"id": rid, "error": f"op không hỗ trợ: {op}"})
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+def make_server(ctl: A_ctl, address: str = DEFAULT_ADDR, max_batch: int = MAX_BATCH,
+                budget_ms: float = BUDGET_MS, max_queue: int = QUEUE_MAX):
+    """Server chưa chạy (gọi serve_forever()); .batcher / .ctl gắn sẵn cho _Handler."""
+    fam, addr = parse_address(address)
+    if fam == socket.AF_INET:
+        srv = _TCPServer(addr, _Handler)
+    else:
+        if os.path.exists(addr):
+            os.unlink(addr)                       # socket cũ của lần chạy trước
+        srv = _UnixServer(addr, _Handler)
+    srv.ctl = ctl
+    srv.batcher = MicroBatcher(ctl, max_batch, budget_ms, max_queue)
+    return srv
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Dịch vụ nhận diện biển số dùng chung cho nhiều máy trạm")
+    ap.add_argument("--listen", default=DEFAULT_ADDR,
+                    help="host:port hoặc unix:/đường/dẫn.sock (mặc định BTL_SERVER hoặc 127.0.0.1:8765)")
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="thời gian chờ gom lô tối đa")
+    ap.add_argument("--queue", type=int, default=QUEUE_MAX)
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--cache-db", action="store_true",
+                    help="giữ cache nhận diện trong bien_so.db qua các lần chạy")
+    args = ap.parse_args()
+
+    srv = make_server(A_ctl(model_path=args.model, cache_persist=args.cache_db), args.listen, args.max_batch, args.budget_ms, args.queue)
+    # SIGTERM: dừng như Ctrl+C (shutdown() phải gọi từ thread khác serve_forever)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=srv.shutdown).start())
+    print(f"Đang phục vụ tại {args.listen}...", file=sys.stderr)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        srv.batcher.stop()
+        fam, addr = parse_address(args.listen)
+        if fam != socket.AF_INET and os.path.exists(addr):
+            os.unlink(addr)
@@ -1,11 +1,12 @@
 from ultralytics import YOLO
 import cv2
+from Controller.backend import pick_device
 
 # nạp model
 model = YOLO("runs/detect/train2/weights/best.pt")
 
 # chạy thử với 1 ảnh
-results = model.predict(source="datasets/test/images/images-1-_png.rf.546429a08b55d26942cad4df99319553.jpg", conf=0.3, device=0)
+results = model.predict(source="datasets/test/images/images-1-_png.rf.546429a08b55d26942cad4df99319553.jpg", conf=0.3, device=pick_device())
 
 # hiển thị kết quả
 for r in results:
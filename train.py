@@ -1,93 +1,272 @@
-import os
-import torch
-import torch.nn as nn
-import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
-from torchvision import models, transforms
-from PIL import Image
-THIET_BI = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-class DatasetBienSo(Dataset):
-    def __init__(self, img_dir, label_dir, transform=None):
-        self.img_dir = img_dir
-        self.label_dir = label_dir
-        self.transform = transform
-        self.images = [f for f in os.listdir(img_dir) if f.endswith(".jpg")]
-
-    def __len__(self):
-        return len(self.images)
-
-    def __getitem__(self, idx):
-        # lấy tên file ảnh
-        img_name = self.images[idx]
-        img_path = os.path.join(self.img_dir, img_name)
-        label_path = os.path.join(
-            self.label_dir, img_name.replace(".jpg", ".txt")
-        )
-        # đọc ảnh RGB
-        image = Image.open(img_path).convert("RGB")
-        if self.transform:
-            image = self.transform(image)
-        # đọc nhãn YOLO từ file .txt
-        class_id = 0
-        if os.path.exists(label_path):
-            with open(label_path, "r") as f:
-                first_line = f.readline().strip().split()
-                if len(first_line) == 5:
-                    # YOLO format: class x_center y_center width height
-                    class_id = int(first_line[0])
-
-        return image, class_id
-# 3. collate_fn để gom batch
-def collate_fn(batch):
-    images = []
-    targets = []
-    for img, box in batch:
-        images.append(img)
-        targets.append(box)
-    images = torch.stack(images, 0)  # ảnh thì stack được
-    return images, targets  # box giữ nguyên list
-# 4. Biến đổi ảnh
-bien_doi_anh = transforms.Compose([
-    transforms.Resize((224, 224)),
-    transforms.ToTensor(),
-])
-# 5. Load dataset Roboflow
-train_dataset = DatasetBienSo(
-    "datasets/train/images", "datasets/train/labels", transform=bien_doi_anh
-)
-val_dataset = DatasetBienSo(
-    "datasets/valid/images", "datasets/valid/labels", transform=bien_doi_anh
-)
-train_loader = DataLoader(
-    train_dataset, batch_size=4, shuffle=True, collate_fn=collate_fn
-)
-val_loader = DataLoader(
-    val_dataset, batch_size=4, shuffle=False, collate_fn=collate_fn
-)
-# 6. Model ResNet50 (trích đặc trưng)
-resnet50 = models.resnet50(weights="IMAGENET1K_V1")
-trich_dac_trung = nn.Sequential(*list(resnet50.children())[:-1]).to(THIET_BI)
-model = nn.Sequential(
-    trich_dac_trung,
-    nn.Flatten(),
-    nn.Linear(2048, 128),
-    nn.ReLU(),
-    nn.Linear(128, 2)  # ví dụ: 2 lớp (có biển số / không)
-).to(THIET_BI)
-# 7. Hàm mất mát + Optimizer
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.Adam(model.parameters(), lr=0.001)
-# 8. Training loop
-for epoch in range(50):
-    model.train()
-    for imgs, boxes in train_loader:
-        imgs = imgs.to(THIET_BI)
-        labels = torch.tensor(boxes, dtype=torch.long).to(THIET_BI)
-
-        outputs = model(imgs)
-        loss = criterion(outputs, labels)
-        optimizer.zero_grad()
-        loss.backward()
-        optimizer.step()
-    print(f"Epoch {epoch+1}, Loss: {loss.item():.4f}")
-print("Huấn luyện xong!")
+import os
+import json
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import Dataset, DataLoader
+from torchvision import models, transforms
+from PIL import Image
+THIET_BI = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+KICH_THUOC = 224
+
+def doc_nhan(label_path):
+    """class_id từ dòng đầu file nhãn YOLO (mặc định 0)."""
+    class_id = 0
+    if os.path.exists(label_path):
+        with open(label_path, "r") as f:
+            first_line = f.readline().strip().split()
+            if len(first_line) == 5:
+                # YOLO format: class x_center y_center width height
+                class_id = int(first_line[0])
+    return class_id
+
+class DatasetBienSo(Dataset):
+    def __init__(self, img_dir, label_dir, transform=None):
+        self.img_dir = img_dir
+        self.label_dir = label_dir
+        self.transform = transform
+        self.images = sorted(f for f in os.listdir(img_dir) if f.endswith(".jpg"))
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, idx):
+        # lấy tên file ảnh
+        img_name = self.images[idx]
+        img_path = os.path.join(self.img_dir, img_name)
+        label_path = os.path.join(
+            self.label_dir, img_name.replace(".jpg", ".txt")
+        )
+        # đọc ảnh RGB
+        image = Image.open(img_path).convert("RGB")
+        if self.transform:
+            image = self.transform(image)
+        return image, doc_nhan(label_path)
+
+# ===== Bộ dữ liệu đã biên dịch (decode 1 lần, đọc bằng memmap) =====
+def bien_dich_dataset(img_dir, label_dir, out_dir, size=KICH_THUOC, lam_lai=False):
+    """
+    Decode + resize mọi ảnh 1 lần -> out_dir/images.npy (N, size, size, 3) uint8
+    và out_dir/labels.npy (N,) int64. meta.json lưu tên/size/mtime từng file:
+    dataset không đổi thì lần sau bỏ qua bước này.
+    """
+    ds = DatasetBienSo(img_dir, label_dir)
+    meta = {"size": size, "files": [
+        [f, os.path.getsize(os.path.join(img_dir, f)), os.path.getmtime(os.path.join(img_dir, f))]
+        for f in ds.images]}
+    meta_path = os.path.join(out_dir, "meta.json")
+    if not lam_lai and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f) == meta:
+                return out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    x = np.lib.format.open_memmap(os.path.join(out_dir, "images.npy"), mode="w+",
+                                  dtype=np.uint8, shape=(len(ds), size, size, 3))
+    y = np.empty(len(ds), np.int64)
+    for i, name in enumerate(ds.images):
+        img = Image.open(os.path.join(img_dir, name)).convert("RGB")
+        x[i] = np.asarray(img.resize((size, size), Image.BILINEAR))  # như transforms.Resize
+        y[i] = doc_nhan(os.path.join(label_dir, name.replace(".jpg", ".txt")))
+    x.flush(); del x
+    np.save(os.path.join(out_dir, "labels.npy"), y)
+    with open(meta_path, "w", encoding="utf-8") as f:   # ghi sau cùng: dở dang thì lần sau làm lại
+        json.dump(meta, f)
+    print(f"Đã biên dịch {len(ds)} ảnh -> {out_dir}")
+    return out_dir
+
+class DatasetMemmap(Dataset):
+    """Đọc thẳng từ images.npy (memmap, không copy); trả ảnh HWC uint8 + nhãn.
+    Mỗi worker tự mở memmap (không pickle mảng sang tiến trình con)."""
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.labels = np.load(os.path.join(cache_dir, "labels.npy"))
+        self._x = None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        return {**self.__dict__, "_x": None}
+
+    def __getitem__(self, idx):
+        if self._x is None:
+            self._x = np.load(os.path.join(self.cache_dir, "images.npy"), mmap_mode="r")
+        return self._x[idx], int(self.labels[idx])
+
+# 3. collate_fn để gom batch
+def collate_fn(batch):
+    images = []
+    targets = []
+    for img, box in batch:
+        images.append(img)
+        targets.append(box)
+    images = torch.stack(images, 0)  # ảnh thì stack được
+    return images, targets  # box giữ nguyên list
+
+def collate_u8(batch):
+    """Gom ảnh uint8 HWC -> tensor uint8 NCHW (1 lần copy); đổi sang float ở thiết bị."""
+    images = torch.from_numpy(np.stack([img for img, _ in batch])).permute(0, 3, 1, 2)
+    return images, [c for _, c in batch]
+
+def ve_float(imgs):
+    """uint8 [0,255] -> float [0,1] giống transforms.ToTensor."""
+    imgs = imgs.to(THIET_BI, non_blocking=True)
+    return imgs.float().div_(255) if imgs.dtype == torch.uint8 else imgs
+
+# 4. Biến đổi ảnh
+bien_doi_anh = transforms.Compose([
+    transforms.Resize((KICH_THUOC, KICH_THUOC)),
+    transforms.ToTensor(),
+])
+
+def tao_loader(args, split, shuffle):
+    img_dir = os.path.join(args.data, split, "images")
+    label_dir = os.path.join(args.data, split, "labels")
+    if args.no_cache:
+        ds, collate = DatasetBienSo(img_dir, label_dir, transform=bien_doi_anh), collate_fn
+    else:
+        out = bien_dich_dataset(img_dir, label_dir, os.path.join(args.cache, split), lam_lai=args.rebuild)
+        ds, collate = DatasetMemmap(out), collate_u8
+    return DataLoader(
+        ds, batch_size=args.batch, shuffle=shuffle, collate_fn=collate,
+        num_workers=args.workers, persistent_workers=args.workers > 0 and not args.no_persistent,
+        pin_memory=THIET_BI.type == "cuda" if args.pin_memory is None else args.pin_memory,
+    )
+
+# 6. Model ResNet50 (trích đặc trưng)
+def tao_model():
+    resnet50 = models.resnet50(weights="IMAGENET1K_V1")
+    trich_dac_trung = nn.Sequential(*list(resnet50.children())[:-1])
+    return nn.Sequential(
+        trich_dac_trung,
+        nn.Flatten(),
+        nn.Linear(2048, 128),
+        nn.ReLU(),
+        nn.Linear(128, 2)  # ví dụ: 2 lớp (có biển số / không)
+    ).to(THIET_BI)
+
+# ===== Cache đặc trưng backbone (chỉ train phần sau) =====
+# --mode:
+#   head     : cả ResNet50 -> vector 2048, chỉ train Linear(2048,128)->Linear(128,2)
+#   finetune : tới hết layer3 -> (1024,14,14), train layer4 + avgpool + head
+def tach_model(model, mode):
+    """-> (mạng trích đặc trưng đóng băng, phần được train). Dùng chung module với model."""
+    backbone = model[0]
+    if mode == "head":
+        return backbone, model[1:]
+    return backbone[:7], nn.Sequential(backbone[7], backbone[8], *model[1:])
+
+@torch.no_grad()
+def tinh_dac_trung(net, cache_dir, ten, batch=64, workers=0):
+    """Chạy net 1 lần trên bộ dữ liệu đã biên dịch -> cache_dir/<ten>.npy (float16, memmap).
+    Bỏ qua nếu images.npy không đổi kể từ lần tính trước."""
+    out = os.path.join(cache_dir, f"{ten}.npy")
+    stamp = os.path.join(cache_dir, f"{ten}.json")
+    src = os.path.getmtime(os.path.join(cache_dir, "images.npy"))
+    if os.path.exists(stamp) and os.path.exists(out):
+        with open(stamp, "r", encoding="utf-8") as f:
+            if json.load(f).get("images_mtime") == src:
+                return out
+    loader = DataLoader(DatasetMemmap(cache_dir), batch_size=batch, shuffle=False,
+                        collate_fn=collate_u8, num_workers=workers)
+    net.eval()
+    feats, i = None, 0
+    for imgs, _ in loader:
+        f = net(ve_float(imgs)).cpu().numpy().astype(np.float16)
+        if feats is None:
+            feats = np.lib.format.open_memmap(out, mode="w+", dtype=np.float16,
+                                              shape=(len(loader.dataset),) + f.shape[1:])
+        feats[i:i + len(f)] = f
+        i += len(f)
+    if feats is None:
+        raise RuntimeError(f"Dataset rỗng: {cache_dir}")
+    feats.flush(); del feats
+    with open(stamp, "w", encoding="utf-8") as f:
+        json.dump({"images_mtime": src}, f)
+    return out
+
+class DatasetDacTrung(Dataset):
+    """Đặc trưng đã cache + nhãn. Vector nhỏ (head) thì nạp hết vào RAM, còn lại đọc memmap."""
+    def __init__(self, feat_path, labels):
+        self.feat_path = feat_path
+        x = np.load(feat_path, mmap_mode="r")
+        self.in_ram = x[0].size <= 4096
+        self.x = np.asarray(x, dtype=np.float32) if self.in_ram else None
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getstate__(self):
+        return self.__dict__ if self.in_ram else {**self.__dict__, "x": None}
+
+    def __getitem__(self, idx):
+        if self.x is None:
+            self.x = np.load(self.feat_path, mmap_mode="r")
+        return torch.from_numpy(np.asarray(self.x[idx], dtype=np.float32)), int(self.labels[idx])
+
+def main():
+    ap = argparse.ArgumentParser(description="Huấn luyện bộ phân loại có biển số / không")
+    ap.add_argument("--data", default="datasets", help="thư mục dataset Roboflow (train/, valid/)")
+    ap.add_argument("--cache", default="datasets/.cache", help="nơi ghi bộ dữ liệu đã biên dịch")
+    ap.add_argument("--no-cache", action="store_true", help="đọc JPEG mỗi epoch như cũ")
+    ap.add_argument("--rebuild", action="store_true", help="biên dịch lại dù dataset không đổi")
+    ap.add_argument("--epochs", type=int, default=50)
+    ap.add_argument("--batch", type=int, default=4)
+    ap.add_argument("--lr", type=float, default=0.001)
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--no-persistent", action="store_true", help="tắt persistent_workers")
+    ap.add_argument("--mode", choices=["full", "head", "finetune"], default="full",
+                    help="full: train cả ResNet50 mỗi epoch; head: cache vector 2048 rồi chỉ train head; "
+                         "finetune: cache đầu ra layer3, train layer4 + head")
+    ap.add_argument("--embed-batch", type=int, default=64, help="batch khi tính đặc trưng")
+    ap.add_argument("--out", default=None, help="lưu state_dict của model sau khi train")
+    ap.add_argument("--pin-memory", type=lambda s: s.lower() in ("1", "true", "yes"), default=None,
+                    help="mặc định: bật khi có CUDA")
+    args = ap.parse_args()
+    if args.mode != "full" and args.no_cache:
+        ap.error("--mode head/finetune cần bộ dữ liệu đã biên dịch (bỏ --no-cache)")
+
+    model = tao_model()
+    if args.mode == "full":
+        # 5. Load dataset Roboflow
+        train_loader = tao_loader(args, "train", shuffle=True)
+        val_loader = tao_loader(args, "valid", shuffle=False)
+        trainable = model
+    else:
+        # backbone chạy đúng 1 lần cho cả dataset, các epoch chỉ chạm vào phần sau
+        feat_net, trainable = tach_model(model, args.mode)
+        for p in feat_net.parameters():
+            p.requires_grad_(False)
+        cache_dir = bien_dich_dataset(os.path.join(args.data, "train", "images"),
+                                      os.path.join(args.data, "train", "labels"),
+                                      os.path.join(args.cache, "train"), lam_lai=args.rebuild)
+        feat_path = tinh_dac_trung(feat_net, cache_dir, f"feat_{args.mode}",
+                                   args.embed_batch, args.workers)
+        ds = DatasetDacTrung(feat_path, DatasetMemmap(cache_dir).labels)
+        train_loader = DataLoader(ds, batch_size=args.batch, shuffle=True, collate_fn=collate_fn,
+                                  num_workers=0 if args.mode == "head" else args.workers)
+    # 7. Hàm mất mát + Optimizer
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam([p for p in trainable.parameters() if p.requires_grad], lr=args.lr)
+    # 8. Training loop
+    for epoch in range(args.epochs):
+        trainable.train()
+        for imgs, boxes in train_loader:
+            imgs = ve_float(imgs)
+            labels = torch.tensor(boxes, dtype=torch.long).to(THIET_BI)
+
+            outputs = trainable(imgs)
+            loss = criterion(outputs, labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+        print(f"Epoch {epoch+1}, Loss: {loss.item():.4f}")
+    print("Huấn luyện xong!")
+    if args.out:
+        torch.save(model.state_dict(), args.out)   # model đầy đủ (backbone + head đã train)
+
+if __name__ == "__main__":
+    main()
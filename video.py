@@ -0,0 +1,112 @@
+# video.py  (nhận diện trên video / camera, theo dõi xe + bỏ phiếu OCR)
+from __future__ import annotations
+import argparse, json, sys, time
+from pathlib import Path
+import cv2
+
+from Controller.ctl import A_ctl, DET_CONF, _expand_box, _norm, _pretty, PLATE_CANON
+from Controller.track import IouTracker, vote_chars
+
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+# ===== Config =====
+MIN_HITS  = 2    # track phải xuất hiện >= MIN_HITS frame mới OCR (lọc box nhiễu)
+MAX_READS = 3    # số lần OCR tối đa cho 1 track
+OCR_EVERY = 5    # khoảng cách tối thiểu (frame) giữa 2 lần OCR của 1 track
+
+def open_source(src: str):
+    """Sinh (số frame, ảnh BGR) từ: chỉ số camera ('0'), file/URL video,
+    hoặc thư mục ảnh theo thứ tự tên (giả lập stream)."""
+    p = Path(src)
+    if p.is_dir():
+        for i, f in enumerate(sorted(f for f in p.iterdir() if f.suffix.lower() in IMG_EXTS)):
+            img = cv2.imread(str(f))
+            if img is not None:
+                yield i, img
+        return
+    cap = cv2.VideoCapture(int(src) if src.isdigit() else src)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Không mở được nguồn video: {src}")
+    i = 0
+    try:
+        while True:
+            ok, img = cap.read()
+            if not ok:
+                break
+            yield i, img
+            i += 1
+    finally:
+        cap.release()
+
+def _finish(track) -> dict | None:
+    text, agree = vote_chars(track.reads)
+    if not text:
+        return None
+    return {"track": track.id, "text": _pretty(text) if PLATE_CANON.match(text) else text,
+            "agree": round(agree, 3), "reads": [t for t, _ in track.reads],
+            "det_conf": round(track.best_conf, 4),
+            "first_frame": track.first_frame, "last_frame": track.last_frame}
+
+def run(ctl: A_ctl, frames, stride=1, save_db=False, on_plate=print):
+    tracker = IouTracker()
+    n = n_ocr = 0
+    t0 = time.perf_counter()
+
+    def emit(done):
+        for t in done:
+            rec = _finish(t)
+            if rec is None:
+                continue
+            if save_db:
+                rec["id"] = ctl.history(rec["text"], t.best_crop)
+            on_plate(rec)
+
+    for fi, img in frames:
+        if fi % stride:
+            continue
+        n += 1
+        det = ctl.detector.predict(source=img, conf=DET_CONF, device=ctl.device, verbose=False)[0]
+        boxes = [(tuple(map(int, b)), float(c))
+                 for b, c in zip(det.boxes.xyxy.tolist(), det.boxes.conf.tolist())]
+        live, done = tracker.update(boxes, fi)
+        emit(done)
+
+        # chỉ OCR track đủ tuổi, chưa đủ số lần đọc, và cách lần đọc trước đủ xa
+        todo = [t for t in live
+                if t.hits >= MIN_HITS and len(t.reads) < MAX_READS and fi - t.last_ocr >= OCR_EVERY]
+        crops = []
+        for t in todo:
+            _, crop = _expand_box(img, t.bbox)
+            crops.append(crop)
+            if t.conf > t.best_conf:
+                t.best_conf, t.best_crop = t.conf, crop.copy()
+        if crops:
+            n_ocr += len(crops)
+            for t, r in zip(todo, ctl.read_crops(crops)):
+                t.last_ocr = fi
+                t.reads.append((_norm(r["text"]), max(r["ocr_conf"], 1e-3) * t.conf))
+    emit(tracker.flush())
+
+    dt = time.perf_counter() - t0
+    return {"frames": n, "ocr_calls": n_ocr, "seconds": round(dt, 2),
+            "fps": round(n / dt, 2) if dt else 0.0}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Nhận diện biển số trên video/camera")
+    ap.add_argument("source", help="file video, URL, chỉ số camera (0) hoặc thư mục ảnh")
+    ap.add_argument("-o", "--out", default="-", help="file .jsonl ('-' = stdout)")
+    ap.add_argument("--stride", type=int, default=1, help="chỉ xử lý 1 trên N frame")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--save-db", action="store_true", help="ghi mỗi xe 1 dòng vào lichsu")
+    args = ap.parse_args()
+
+    f = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    def on_plate(rec):
+        f.write(json.dumps(rec, ensure_ascii=False) + "\n"); f.flush()
+    try:
+        stats = run(A_ctl(model_path=args.model), open_source(args.source),
+                    args.stride, args.save_db, on_plate)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    print(json.dumps(stats), file=sys.stderr)